@@ -1,39 +1,37 @@
 import hashlib
-import openai
-import PyPDF2
-import docx
-import streamlit as st
-from io import BytesIO
-from docx import Document
-
-MARITACA_API_KEY = st.secrets.get("MARITACA_API_KEY")
-client = None
-if MARITACA_API_KEY:
-    client = openai.OpenAI(api_key=MARITACA_API_KEY, base_url="https://chat.maritaca.ai/api")
-
-
-def ler_pdf(arquivo):
-
-    texto = ""
-    leitor = PyPDF2.PdfReader(arquivo)
-    for pagina in leitor.pages:
-        texto_pagina = pagina.extract_text()
-        if texto_pagina:
-            texto += texto_pagina + "\n"
-    return texto.strip()
-
+import html
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
+from itertools import zip_longest
 
-def ler_txt(arquivo):
-
-    arquivo.seek(0)
-    return arquivo.read().decode("utf-8").strip()
-
-
-def ler_docx(arquivo):
-
-    arquivo.seek(0)
-    doc = docx.Document(arquivo)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+import streamlit as st
+from armazenamento import guardar_na_sessao, ler_da_sessao, obter_armazem
+from cache import chave_cache, obter_cache
+from configuracao import obter_config
+from extracao import extrair_texto_salvo, extrair_texto_upload, resumo_extracao, salvar_upload
+from geracao import executar_concorrente_em_fluxo, fluxo_em_ordem
+from maritaca import chat_with_bot_stream, configurado
+from roteamento import assinatura
+from tokens import estimar_tokens
+from trabalhos import CONCLUIDO, FALHOU, obter_gerenciador
+
+MAX_TOKENS_BLOCO = int(obter_config("CORRETOR_MAX_TOKENS_BLOCO", 1200))
+CONTEXTO_BLOCO_CARACTERES = int(obter_config("CORRETOR_CONTEXTO_CARACTERES", 400))
+MAX_CONCORRENCIA = int(obter_config("CORRETOR_MAX_CONCORRENCIA", 4))
+# Arquivos de um lote revisados ao mesmo tempo.
+MAX_ARQUIVOS_SIMULTANEOS = int(obter_config("CORRETOR_MAX_ARQUIVOS", 4))
+# Incrementar ao mudar o prompt de revisão, para invalidar o cache.
+VERSAO_REVISAO = 1
+# Acima disto, blocos desalinhados do diff são pareados por posição em vez
+# de comparados inteiros no nível seguinte.
+MAX_CARACTERES_REALINHAR = 2000
+INTERVALO_ATUALIZACAO = 0.5
+# Campos mantidos enquanto a aba está fechada (ver app.manter_estado).
+CHAVES_ESTADO = ("corretor_texto_colado", "corretor_idioma")
 
 
 def criar_preprompt(texto, idioma):
@@ -49,36 +47,489 @@ def criar_preprompt(texto, idioma):
     }
 
 
-def chat_with_bot(user_input, preprompt):
+def _agrupar(pedacos, separador, max_tokens):
 
-    try:
-        if client is None:
-            return "MARITACA_API_KEY não configurada. Defina-a em .streamlit/secrets.toml."
-        response = client.chat.completions.create(
-            model="sabiazim-3",
-            messages=[preprompt, {"role": "user", "content": user_input}],
-            temperature=0.7,
-            max_tokens=2048
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Erro na comunicação com a API: {e}"
+    grupos = []
+    atual = []
+    tamanho = 0
+    for pedaco in pedacos:
+        tokens = estimar_tokens(pedaco)
+        if atual and tamanho + tokens > max_tokens:
+            grupos.append(separador.join(atual))
+            atual = []
+            tamanho = 0
+        atual.append(pedaco)
+        tamanho += tokens
+    if atual:
+        grupos.append(separador.join(atual))
+    return grupos
 
 
-def revisar_texto(conteudo, preprompt):
+def _dividir_trecho(trecho, max_tokens):
+
+    frases = []
+    for frase in re.split(r"(?<=[.!?…])\s+", trecho):
+        if estimar_tokens(frase) > max_tokens:
+            frases.extend(_agrupar(frase.split(), " ", max_tokens))
+        else:
+            frases.append(frase)
+    return _agrupar(frases, " ", max_tokens)
+
+
+def _juntar(paragrafos, max_tokens, agrupar):
+
+    return _agrupar(paragrafos, "\n\n", max_tokens) if agrupar else paragrafos
+
+
+def dividir_em_blocos(texto, max_tokens=MAX_TOKENS_BLOCO, agrupar=True):
+
+    # Devolve [(separador, bloco)], onde separador é o que unia o bloco ao
+    # anterior no texto original ("\n\n" entre parágrafos, " " dentro de um).
+    # Com agrupar=False cada parágrafo vira um bloco (exceto os longos demais,
+    # que continuam divididos por frases).
+    blocos = []
+    paragrafos = []
+    for paragrafo in [p.strip() for p in re.split(r"\n\s*\n", texto) if p.strip()]:
+        if estimar_tokens(paragrafo) <= max_tokens:
+            paragrafos.append(paragrafo)
+            continue
+        blocos.extend(("\n\n", bloco) for bloco in _juntar(paragrafos, max_tokens, agrupar))
+        paragrafos = []
+        for i, pedaco in enumerate(_dividir_trecho(paragrafo, max_tokens)):
+            blocos.append((" " if i else "\n\n", pedaco))
+    blocos.extend(("\n\n", bloco) for bloco in _juntar(paragrafos, max_tokens, agrupar))
+    return blocos
+
+
+def _prompt_bloco(bloco, contexto_anterior):
 
     prompt_revisao = (
         "Revisão ortográfica e de coerência\n\n"
-        "Revise o texto abaixo corrigindo erros ortográficos, gramaticais e problemas de coerência. "
-        "Mantenha o sentido original, melhore a fluidez e entregue apenas o texto revisado.\n\nTexto:\n"
-        + conteudo
+        "Revise o trecho abaixo corrigindo erros ortográficos, gramaticais e problemas de coerência. "
+        "Mantenha o sentido original, melhore a fluidez e entregue apenas o trecho revisado. "
+        "Preserve a divisão em parágrafos (separados por uma linha em branco)."
+    )
+    if contexto_anterior:
+        prompt_revisao += (
+            "\n\nContexto anterior (apenas para manter a coerência, não revise nem repita):\n"
+            + contexto_anterior
+        )
+    return prompt_revisao + "\n\nTrecho:\n" + bloco
+
+
+def chave_paragrafo(paragrafo, idioma):
+
+    # Só o próprio parágrafo entra na chave: o contexto vizinho enviado no
+    # prompt serve apenas para coerência, e editar um parágrafo não deve
+    # invalidar a revisão dos vizinhos.
+    paragrafo_hash = hashlib.sha256(paragrafo.encode("utf-8")).hexdigest()
+    return chave_cache("corretor", paragrafo_hash, idioma, VERSAO_REVISAO, assinatura("corretor"))
+
+
+def _inteiro(unidades, i):
+
+    # A unidade é um parágrafo inteiro, e não um pedaço de um parágrafo longo.
+    return unidades[i][0] == "\n\n" and (i + 1 == len(unidades) or unidades[i + 1][0] == "\n\n")
+
+
+def planejar_revisao(texto, idioma, max_tokens=MAX_TOKENS_BLOCO):
+
+    # Devolve (unidades, segmentos). Unidades são os parágrafos do texto;
+    # segmentos são as unidades já revisadas (em cache) ou os grupos de
+    # unidades consecutivas que ainda precisam ir para a API, até max_tokens.
+    cache = obter_cache()
+    unidades = dividir_em_blocos(texto, max_tokens, agrupar=False)
+    segmentos = []
+    for i, (separador, unidade) in enumerate(unidades):
+        revisado = cache.obter(chave_paragrafo(unidade, idioma))
+        tokens = estimar_tokens(unidade)
+        if revisado is not None:
+            segmentos.append({"separador": separador, "revisado": revisado, "unidades": [i], "tokens": tokens})
+            continue
+        anterior = segmentos[-1] if segmentos else None
+        if (
+            anterior is not None
+            and anterior["revisado"] is None
+            and anterior["tokens"] + tokens <= max_tokens
+            and _inteiro(unidades, i)
+            and all(_inteiro(unidades, j) for j in anterior["unidades"])
+        ):
+            anterior["unidades"].append(i)
+            anterior["tokens"] += tokens
+        else:
+            segmentos.append({"separador": separador, "revisado": None, "unidades": [i], "tokens": tokens})
+    # Grupos que a API devolveu sem a mesma divisão em parágrafos ficam em
+    # cache inteiros (ver _gravar_revisao).
+    for segmento in segmentos:
+        if segmento["revisado"] is None and len(segmento["unidades"]) > 1:
+            trecho = "\n\n".join(unidades[j][1] for j in segmento["unidades"])
+            segmento["revisado"] = cache.obter(chave_paragrafo(trecho, idioma))
+    return unidades, segmentos
+
+
+def _gravar_revisao(segmento, unidades, revisado, idioma):
+
+    # Um grupo de parágrafos só vai para o cache parágrafo a parágrafo se a
+    # revisão manteve a mesma quantidade deles; senão, fica o grupo inteiro.
+    cache = obter_cache()
+    originais = [unidades[j][1] for j in segmento["unidades"]]
+    if len(originais) == 1:
+        partes = [revisado.strip()]
+    else:
+        partes = [p.strip() for p in re.split(r"\n\s*\n", revisado.strip()) if p.strip()]
+    if len(partes) != len(originais):
+        cache.gravar(chave_paragrafo("\n\n".join(originais), idioma), revisado.strip())
+        return
+    for original, parte in zip(originais, partes):
+        cache.gravar(chave_paragrafo(original, idioma), parte)
+
+
+def revisar_plano_stream(unidades, segmentos, idioma, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None):
+
+    # Revisa os segmentos pendentes em paralelo, mas entrega o texto em
+    # ordem: os segmentos em cache saem direto, o pendente da vez é repassado
+    # enquanto chega e os seguintes ficam em buffer.
+    preprompt = criar_preprompt("Contexto: revisão de texto dividido em trechos.", idioma)
+    tarefas = {}
+    for indice, segmento in enumerate(segmentos):
+        if segmento["revisado"] is not None:
+            continue
+        primeira = segmento["unidades"][0]
+        contexto_anterior = unidades[primeira - 1][1][-CONTEXTO_BLOCO_CARACTERES:] if primeira > 0 else ""
+        trecho = "\n\n".join(unidades[j][1] for j in segmento["unidades"])
+        tarefas[indice] = lambda trecho=trecho, contexto_anterior=contexto_anterior: chat_with_bot_stream(
+            _prompt_bloco(trecho, contexto_anterior), preprompt, secao="corretor"
+        )
+
+    def concluir(indice, revisado, concluidos, total):
+        _gravar_revisao(segmentos[indice], unidades, revisado, idioma)
+        if ao_concluir is not None:
+            ao_concluir(indice, revisado, concluidos, total)
+
+    eventos = executar_concorrente_em_fluxo(tarefas, max_concorrencia=max_concorrencia, ao_concluir=concluir)
+    fluxo = fluxo_em_ordem(eventos, list(tarefas))
+    for indice, segmento in enumerate(segmentos):
+        separador = segmento["separador"] if indice > 0 else ""
+        if segmento["revisado"] is not None:
+            yield separador + segmento["revisado"]
+            continue
+        inicio_bloco = True
+        for _indice, trecho in fluxo:
+            if trecho is None:
+                break
+            if inicio_bloco:
+                trecho = trecho.lstrip()
+                if not trecho:
+                    continue
+                trecho = separador + trecho
+                inicio_bloco = False
+            yield trecho
+
+
+def revisar_texto_em_blocos_stream(texto, idioma, max_tokens=MAX_TOKENS_BLOCO, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None):
+
+    unidades, segmentos = planejar_revisao(texto, idioma, max_tokens)
+    return revisar_plano_stream(unidades, segmentos, idioma, max_concorrencia, ao_concluir)
+
+
+def revisar_texto_em_blocos(texto, idioma, max_tokens=MAX_TOKENS_BLOCO, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None):
+
+    return "".join(
+        revisar_texto_em_blocos_stream(texto, idioma, max_tokens, max_concorrencia, ao_concluir)
+    ).strip()
+
+
+# Níveis do diff: parágrafos, frases e, por fim, palavras.
+_NIVEIS_DIFF = (r"\n\s*\n", r"(?<=[.!?…])\s+", r"\s+")
+
+
+def _segmentos_diff(texto, padrao):
+
+    # Divide mantendo cada separador colado ao pedaço anterior, para que
+    # "".join(segmentos) == texto.
+    partes = re.split(f"({padrao})", texto)
+    segmentos = [partes[i] + (partes[i + 1] if i + 1 < len(partes) else "") for i in range(0, len(partes), 2)]
+    return [s for s in segmentos if s]
+
+
+def _diff(original, revisado, nivel, adicionar):
+
+    a = _segmentos_diff(original, _NIVEIS_DIFF[nivel])
+    b = _segmentos_diff(revisado, _NIVEIS_DIFF[nivel])
+    ultimo_nivel = nivel == len(_NIVEIS_DIFF) - 1
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal":
+            adicionar("igual", "".join(a[i1:i2]))
+        elif ultimo_nivel:
+            adicionar("removido", "".join(a[i1:i2]))
+            adicionar("inserido", "".join(b[j1:j2]))
+        elif i2 - i1 == j2 - j1 or len("".join(a[i1:i2])) + len("".join(b[j1:j2])) > MAX_CARACTERES_REALINHAR:
+            for x, y in zip_longest(a[i1:i2], b[j1:j2], fillvalue=""):
+                if x and y:
+                    _diff(x, y, nivel + 1, adicionar)
+                else:
+                    adicionar("removido", x)
+                    adicionar("inserido", y)
+        else:
+            _diff("".join(a[i1:i2]), "".join(b[j1:j2]), nivel + 1, adicionar)
+
+
+def diff_palavras(original, revisado):
+
+    # Devolve [(operacao, texto)] com operacao "igual", "removido" ou
+    # "inserido". Alinha parágrafos, depois frases, e só compara palavra a
+    # palavra dentro das frases alteradas: o SequenceMatcher nunca vê o texto
+    # inteiro como uma sequência de palavras, o que seria quadrático.
+    operacoes = []
+
+    def adicionar(operacao, texto):
+        if not texto:
+            return
+        if operacoes and operacoes[-1][0] == operacao:
+            operacoes[-1] = (operacao, operacoes[-1][1] + texto)
+        else:
+            operacoes.append((operacao, texto))
+
+    _diff(original, revisado, 0, adicionar)
+    return operacoes
+
+
+def diff_html(operacoes):
+
+    formatos = {
+        "igual": "{}",
+        "removido": "<del style='background:#fdd;color:#a00;'>{}</del>",
+        "inserido": "<ins style='background:#dfd;color:#060;text-decoration:none;'>{}</ins>",
+    }
+    return "".join(formatos[operacao].format(html.escape(texto)) for operacao, texto in operacoes)
+
+
+def chave_trabalho(texto, idioma):
+
+    texto_hash = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+    return chave_cache("corretor_trabalho", texto_hash, idioma, VERSAO_REVISAO, assinatura("corretor"))
+
+
+def trabalho_revisao(unidades, segmentos, idioma, max_concorrencia=MAX_CONCORRENCIA):
+
+    # Função para o gerenciador de trabalhos: publica o texto revisado em
+    # "texto" conforme chega e devolve o texto completo.
+    def executar(trabalho):
+        trabalho.progredir(0, sum(1 for s in segmentos if s["revisado"] is None))
+
+        def ao_concluir(_indice, _revisado, concluidos, total):
+            trabalho.progredir(concluidos, total)
+
+        for trecho in revisar_plano_stream(unidades, segmentos, idioma, max_concorrencia, ao_concluir):
+            trabalho.anexar("texto", trecho)
+        return trabalho.texto("texto").strip()
+
+    return executar
+
+
+@st.fragment(run_every=INTERVALO_ATUALIZACAO)
+def acompanhar_revisao():
+
+    info = st.session_state["corretor_trabalho"]
+    trabalho = obter_gerenciador().obter(info["id"])
+    if trabalho is None:
+        del st.session_state["corretor_trabalho"]
+        st.warning("A revisão em andamento não foi encontrada; revise o texto novamente.")
+        return
+
+    estado = trabalho.instantaneo()
+    concluidos, total = estado["progresso"]
+    if estado["estado"] == CONCLUIDO:
+        del st.session_state["corretor_trabalho"]
+        guardar_na_sessao("corretor_texto_revisado", estado["resultado"])
+        st.session_state["corretor_aviso"] = "Revisão concluída com sucesso!"
+        st.rerun(scope="app")
+    if estado["estado"] == FALHOU:
+        del st.session_state["corretor_trabalho"]
+        st.error(f"A revisão falhou; os trechos concluídos ficaram no cache. {estado['erro']}")
+        return
+
+    st.progress(int(concluidos / total * 100) if total else 0)
+    st.caption(f"Trecho {concluidos}/{total} revisado.")
+    st.markdown(estado["parciais"].get("texto", ""))
+
+
+def chave_lote(arquivos, idioma):
+
+    conteudo = "\n".join(f"{nome}:{file_hash}" for nome, _caminho, file_hash, _tamanho in arquivos)
+    lote_hash = hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+    return chave_cache("corretor_lote", lote_hash, idioma, VERSAO_REVISAO, assinatura("corretor"))
+
+
+def trabalho_lote(arquivos, idioma, max_arquivos=MAX_ARQUIVOS_SIMULTANEOS):
+
+    # arquivos: [(nome, caminho, hash, tamanho)] gravados por salvar_upload,
+    # removidos ao final. Vários arquivos são revisados ao mesmo tempo, cada
+    # um com seus trechos em paralelo; o semáforo do cliente Maritaca é o
+    # limite comum de chamadas. Cada texto revisado vai para o armazém assim
+    # que fica pronto e o resultado traz só os identificadores.
+    def executar(trabalho):
+        armazem = obter_armazem()
+
+        def processar(indice):
+            nome, caminho, file_hash, tamanho = arquivos[indice]
+            trabalho.detalhar(indice, estado="extraindo")
+            extracao = extrair_texto_salvo(nome, caminho, file_hash, tamanho)
+            unidades, segmentos = planejar_revisao(extracao.texto, idioma)
+            reaproveitados = sum(len(s["unidades"]) for s in segmentos if s["revisado"] is not None)
+            trabalho.detalhar(
+                indice, estado="revisando", concluidos=0, total=sum(1 for s in segmentos if s["revisado"] is None)
+            )
+
+            def ao_concluir(_indice, _revisado, concluidos, total):
+                trabalho.detalhar(indice, concluidos=concluidos, total=total)
+
+            revisado = "".join(revisar_plano_stream(unidades, segmentos, idioma, ao_concluir=ao_concluir)).strip()
+            return {
+                "nome": nome,
+                "handle": armazem.guardar("lote:" + trabalho.id, revisado),
+                "paragrafos": len(unidades),
+                "reaproveitados": reaproveitados,
+                "erro": None,
+            }
+
+        resultados = [None] * len(arquivos)
+        trabalho.progredir(0, len(arquivos))
+        try:
+            with ThreadPoolExecutor(max_workers=max_arquivos, thread_name_prefix="corretor-lote") as executor:
+                futuros = {executor.submit(processar, indice): indice for indice in range(len(arquivos))}
+                for feitos, futuro in enumerate(as_completed(futuros), start=1):
+                    indice = futuros[futuro]
+                    try:
+                        resultados[indice] = futuro.result()
+                    except Exception as erro:
+                        # Qualquer falha (API, arquivo corrompido, leitor do
+                        # PDF/DOCX) fica na linha do arquivo, sem derrubar o lote.
+                        motivo = str(erro) or type(erro).__name__
+                        resultados[indice] = {
+                            "nome": arquivos[indice][0], "handle": None, "paragrafos": 0, "reaproveitados": 0,
+                            "erro": motivo,
+                        }
+                        trabalho.detalhar(indice, estado=FALHOU, erro=motivo)
+                    else:
+                        trabalho.detalhar(indice, estado=CONCLUIDO)
+                    trabalho.progredir(feitos, len(arquivos))
+        finally:
+            for _nome, caminho, _hash, _tamanho in arquivos:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+        return resultados
+
+    return executar
+
+
+def _nome_revisado(nome, usados):
+
+    base = os.path.splitext(os.path.basename(nome))[0] + "_revisado"
+    candidato = base + ".txt"
+    numero = 1
+    while candidato in usados:
+        numero += 1
+        candidato = f"{base}_{numero}.txt"
+    usados.add(candidato)
+    return candidato
+
+
+def zip_lote(resultados):
+
+    # Monta o zip num temporário em disco, uma entrada por vez: cada texto é
+    # lido do armazém, comprimido e descartado antes do próximo. Devolve os
+    # bytes do zip (o download_button não aceita o objeto do temporário).
+    armazem = obter_armazem()
+    usados = set()
+    with tempfile.TemporaryFile(prefix="corretor-lote-", suffix=".zip") as destino:
+        with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as pacote:
+            for resultado in resultados:
+                texto = armazem.obter(resultado["handle"]) if resultado["handle"] else None
+                if texto is None:
+                    continue
+                with pacote.open(_nome_revisado(resultado["nome"], usados), "w") as entrada:
+                    entrada.write(texto.encode("utf-8"))
+        destino.seek(0)
+        return destino.read()
+
+
+def iniciar_lote(arquivos, idioma):
+
+    # Cada upload é copiado para disco (calculando o hash na mesma passada);
+    # o trabalho lê dessas cópias, não dos objetos do Streamlit.
+    salvos = []
+    for arquivo in arquivos:
+        try:
+            caminho, file_hash, tamanho = salvar_upload(arquivo.name, arquivo)
+        except ValueError:
+            st.error(f"Formato de arquivo não suportado: {arquivo.name}")
+            continue
+        salvos.append((arquivo.name, caminho, file_hash, tamanho))
+    if not salvos:
+        return
+
+    def apagar_copias():
+        # O mesmo lote já está rodando, com as próprias cópias.
+        for _nome, caminho, _hash, _tamanho in salvos:
+            os.remove(caminho)
+
+    trabalho = obter_gerenciador().submeter(chave_lote(salvos, idioma), trabalho_lote(salvos, idioma), apagar_copias)
+    st.session_state["corretor_lote_trabalho"] = {"id": trabalho.id, "nomes": [nome for nome, *_ in salvos]}
+
+
+def _situacao_arquivo(detalhe):
+
+    estado = detalhe.get("estado")
+    if estado == "extraindo":
+        return "Extraindo texto"
+    if estado == "revisando":
+        return f"Revisando ({detalhe['concluidos']}/{detalhe['total']} trechos)"
+    if estado == CONCLUIDO:
+        return "Concluído"
+    if estado == FALHOU:
+        return f"Erro: {detalhe['erro']}"
+    return "Na fila"
+
+
+@st.fragment(run_every=INTERVALO_ATUALIZACAO)
+def acompanhar_lote():
+
+    info = st.session_state["corretor_lote_trabalho"]
+    trabalho = obter_gerenciador().obter(info["id"])
+    if trabalho is None:
+        del st.session_state["corretor_lote_trabalho"]
+        st.warning("O lote em andamento não foi encontrado; envie os arquivos novamente.")
+        return
+
+    estado = trabalho.instantaneo()
+    feitos, total = estado["progresso"]
+    if estado["estado"] == CONCLUIDO:
+        del st.session_state["corretor_lote_trabalho"]
+        guardar_na_sessao("corretor_lote", estado["resultado"])
+        st.session_state["corretor_aviso"] = "Revisão do lote concluída."
+        st.rerun(scope="app")
+    if estado["estado"] == FALHOU:
+        del st.session_state["corretor_lote_trabalho"]
+        st.error(f"A revisão do lote falhou; os trechos concluídos ficaram no cache. {estado['erro']}")
+        return
+
+    st.progress(int(feitos / total * 100) if total else 0)
+    st.caption(f"{feitos}/{total} arquivo(s) concluído(s).")
+    st.dataframe(
+        [
+            {"Arquivo": nome, "Situação": _situacao_arquivo(estado["detalhes"].get(indice, {}))}
+            for indice, nome in enumerate(info["nomes"])
+        ],
+        hide_index=True
     )
-    return chat_with_bot(prompt_revisao, preprompt)
 
 
 def corretor_ui():
 
-    if client is None:
+    if not configurado():
         st.error("A variável MARITACA_API_KEY não foi definida em .streamlit/secrets.toml.")
         return
 
@@ -88,22 +539,19 @@ def corretor_ui():
         "gramatical e de coerência."
     )
 
-    if "corretor_texto_revisado" not in st.session_state:
-        st.session_state["corretor_texto_revisado"] = None
-    if "corretor_texto_original" not in st.session_state:
-        st.session_state["corretor_texto_original"] = None
-    if "corretor_cache" not in st.session_state:
-        st.session_state["corretor_cache"] = {}
-
     tab1, tab2 = st.tabs(["Carregar Arquivo", "Colar Texto"])
 
     with tab1:
         st.subheader("Carregar Arquivo")
-        arquivo = st.file_uploader(
-            "Envie um arquivo (.pdf, .txt, .docx)",
+        arquivos = st.file_uploader(
+            "Envie um ou mais arquivos (.pdf, .txt, .docx)",
             type=["pdf", "txt", "docx"],
+            accept_multiple_files=True,
             key="corretor_arquivo"
-        )
+        ) or []
+        if len(arquivos) > 1:
+            st.caption(f"{len(arquivos)} arquivos: serão revisados em lote, com download em um único .zip.")
+        arquivo = arquivos[0] if len(arquivos) == 1 else None
 
     with tab2:
         st.subheader("Colar Texto Diretamente")
@@ -126,79 +574,147 @@ def corretor_ui():
     with col2:
         revisar_btn = st.button("Revisar Texto", use_container_width=True, key="corretor_revisar")
 
-    if revisar_btn:
+    if revisar_btn and len(arquivos) > 1:
+        iniciar_lote(arquivos, idioma)
+
+    elif revisar_btn:
 
         if arquivo is not None:
             arquivo.seek(0)
-            file_bytes = arquivo.read()
-            file_hash = hashlib.sha256(file_bytes).hexdigest()
-            file_like = BytesIO(file_bytes)
-            ext = arquivo.name.split(".")[-1].lower()
-
-            if ext == "pdf":
-                texto_origem = ler_pdf(file_like)
-            elif ext == "txt":
-                texto_origem = ler_txt(file_like)
-            elif ext == "docx":
-                texto_origem = ler_docx(file_like)
-            else:
+            try:
+                extracao = extrair_texto_upload(arquivo.name, arquivo)
+            except ValueError:
                 st.error("Formato de arquivo não suportado.")
                 return
+            texto_origem = extracao.texto
+            st.caption(resumo_extracao(extracao))
 
-            cache_key = f"{file_hash}__{idioma}"
         elif texto_colado and texto_colado.strip():
             texto_origem = texto_colado.strip()
-            file_hash = hashlib.sha256(texto_origem.encode()).hexdigest()
-            cache_key = f"{file_hash}__{idioma}"
         else:
             st.error("Por favor, carregue um arquivo ou cole um texto para revisar.")
             return
 
-        if cache_key in st.session_state["corretor_cache"]:
+        unidades, segmentos = planejar_revisao(texto_origem, idioma)
+        pendentes = [segmento for segmento in segmentos if segmento["revisado"] is None]
+
+        # Textos e diff ficam no armazém do processo; a sessão guarda só os
+        # identificadores.
+        guardar_na_sessao("corretor_texto_original", texto_origem)
+        guardar_na_sessao("corretor_diff", None)
+        if not pendentes:
             st.success("Conteúdo carregado do cache.")
-            st.session_state["corretor_texto_revisado"] = st.session_state["corretor_cache"][cache_key]
-            st.session_state["corretor_texto_original"] = texto_origem
+            guardar_na_sessao(
+                "corretor_texto_revisado", "".join(revisar_plano_stream(unidades, segmentos, idioma)).strip()
+            )
         else:
+            guardar_na_sessao("corretor_texto_revisado", None)
+            reaproveitados = sum(len(s["unidades"]) for s in segmentos if s["revisado"] is not None)
+            if reaproveitados:
+                st.caption(
+                    f"{reaproveitados} de {len(unidades)} parágrafo(s) reaproveitado(s) do cache; "
+                    f"{len(pendentes)} trecho(s) enviado(s) para revisão."
+                )
+            # A revisão roda fora do script: reruns e cliques repetidos
+            # reencontram o mesmo trabalho pela chave do texto.
+            trabalho = obter_gerenciador().submeter(
+                chave_trabalho(texto_origem, idioma), trabalho_revisao(unidades, segmentos, idioma)
+            )
+            st.session_state["corretor_trabalho"] = {"id": trabalho.id}
+
+    if st.session_state.get("corretor_trabalho"):
+        acompanhar_revisao()
+
+    if st.session_state.get("corretor_lote_trabalho"):
+        acompanhar_lote()
 
-            with st.spinner("Revisando texto..."):
-                preprompt = criar_preprompt(f"Contexto: revisão de texto\n\n{texto_origem}", idioma)
-                texto_revisado = revisar_texto(texto_origem, preprompt)
-                st.session_state["corretor_texto_revisado"] = texto_revisado
-                st.session_state["corretor_texto_original"] = texto_origem
-                st.session_state["corretor_cache"][cache_key] = texto_revisado
-                st.success("Revisão concluída com sucesso!")
+    if st.session_state.get("corretor_aviso"):
+        st.success(st.session_state.pop("corretor_aviso"))
 
-    if st.session_state.get("corretor_texto_revisado"):
+    texto_revisado = ler_da_sessao("corretor_texto_revisado")
+    texto_original = ler_da_sessao("corretor_texto_original")
+    if st.session_state.get("corretor_texto_revisado") and (texto_revisado is None or texto_original is None):
+        guardar_na_sessao("corretor_texto_revisado", None)
+        st.info("O resultado da revisão saiu da memória do servidor; revise novamente (os trechos vêm do cache).")
+
+    if texto_revisado is not None and texto_original is not None:
         st.markdown("---")
         st.subheader("Resultado da Revisão")
 
-        result_tab1, result_tab2 = st.tabs(["Texto Revisado", "Texto Original"])
+        result_tab1, result_tab2, result_tab3 = st.tabs(["Texto Revisado", "Texto Original", "Diferenças"])
 
         with result_tab1:
             st.text_area(
                 "Texto revisado:",
-                st.session_state["corretor_texto_revisado"],
+                texto_revisado,
                 height=400,
                 disabled=True,
                 key="corretor_result_revisado"
             )
             st.download_button(
                 "Baixar Texto Revisado (TXT)",
-                st.session_state["corretor_texto_revisado"],
+                texto_revisado,
                 file_name="texto_revisado.txt",
                 mime="text/plain",
                 key="corretor_download_revisado"
             )
+            stats_cache = obter_cache().estatisticas()
+            st.caption(
+                f"Cache compartilhado: {stats_cache['hits_memoria'] + stats_cache['hits_disco']} acertos, "
+                f"{stats_cache['misses']} falhas ({stats_cache['taxa_acerto']:.0%})."
+            )
 
         with result_tab2:
             st.text_area(
                 "Texto original:",
-                st.session_state["corretor_texto_original"],
+                texto_original,
                 height=400,
                 disabled=True,
                 key="corretor_result_original"
             )
 
+        with result_tab3:
+            operacoes = ler_da_sessao("corretor_diff")
+            if operacoes is None:
+                operacoes = diff_palavras(texto_original, texto_revisado)
+                guardar_na_sessao("corretor_diff", operacoes)
+            removidas = sum(len(texto.split()) for operacao, texto in operacoes if operacao == "removido")
+            inseridas = sum(len(texto.split()) for operacao, texto in operacoes if operacao == "inserido")
+            st.caption(f"{removidas} palavra(s) removida(s), {inseridas} inserida(s).")
+            st.markdown(
+                "<div style='white-space: pre-wrap; max-height: 400px; overflow-y: auto; "
+                "border: 1px solid #ddd; padding: 8px;'>" + diff_html(operacoes) + "</div>",
+                unsafe_allow_html=True
+            )
+
+    lote = ler_da_sessao("corretor_lote")
+    if lote:
+        st.markdown("---")
+        st.subheader("Resultado do Lote")
+        armazem = obter_armazem()
+        disponiveis = sum(1 for resultado in lote if resultado["handle"] and armazem.contem(resultado["handle"]))
+        st.dataframe(
+            [
+                {
+                    "Arquivo": resultado["nome"],
+                    "Situação": f"Erro: {resultado['erro']}" if resultado["erro"] else "Revisado",
+                    "Parágrafos do cache": f"{resultado['reaproveitados']}/{resultado['paragrafos']}",
+                }
+                for resultado in lote
+            ],
+            hide_index=True
+        )
+        if disponiveis < sum(1 for resultado in lote if resultado["handle"]):
+            st.info("Parte dos textos revisados saiu da memória do servidor e não estará no .zip; revise o lote novamente.")
+        st.download_button(
+            f"Baixar {disponiveis} Texto(s) Revisado(s) (ZIP)",
+            lambda: zip_lote(lote),
+            file_name="textos_revisados.zip",
+            mime="application/zip",
+            disabled=not disponiveis,
+            key="corretor_download_lote"
+        )
+
     st.markdown("---")
     st.markdown(
         "<div style='position: fixed; bottom: 8px; right: 16px; font-size: 10px; color: #888;'>"
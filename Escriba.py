@@ -1,114 +1,113 @@
-import hashlib
 import os
 import json
-import openai
-import PyPDF2
-import docx
+import uuid
 import streamlit as st
-from io import BytesIO
-from docx import Document
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-
-MARITACA_API_KEY = st.secrets.get("MARITACA_API_KEY")
-client = None
-if MARITACA_API_KEY:
-    client = openai.OpenAI(api_key=MARITACA_API_KEY, base_url="https://chat.maritaca.ai/api")
-
-def ler_pdf(arquivo):
-    texto = ""
-    leitor = PyPDF2.PdfReader(arquivo)
-    for pagina in leitor.pages:
-        texto_pagina = pagina.extract_text()
-        if texto_pagina:
-            texto += texto_pagina + "\n"
-    return texto.strip()
-
-def ler_txt(arquivo):
-    arquivo.seek(0)
-    return arquivo.read().decode("utf-8").strip()
-
-def ler_docx(arquivo):
-    arquivo.seek(0)
-    doc = docx.Document(arquivo)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-
-def criar_preprompt(texto, idioma):
-    idioma_text = f"Idioma de saída: {idioma}.\n\n"
-    return {
-        "role": "system",
-        "content": (
-            "Você é um assistente especialista em design educacional e criação de conteúdo. "
-            + idioma_text
-            + f"{texto}"
-        )
-    }
-
-def chat_with_bot(user_input, preprompt):
-    try:
-        if client is None:
-            return "MARITACA_API_KEY não configurada. Defina-a em .streamlit/secrets.toml."
-        response = client.chat.completions.create(
-            model="sabiazim-3",
-            messages=[preprompt, {"role": "user", "content": user_input}],
-            temperature=0.7,
-            max_tokens=2048
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Erro na comunicação com a API: {e}"
-
-def gerar_glossario(conteudo, preprompt):
-    prompt_glossario = (
-        "Seção 3. Glossário geral\n\n"
-        "Com base no texto abaixo, identifique as palavras ou termos difíceis, técnicos ou pouco usuais para o público geral. "
-        "Apresente no formato: N°:\\tTermo:\\tDefinição / significado. Texto base:\n" + conteudo
+from armazenamento import guardar_na_sessao, ler_da_sessao
+from cache import chave_cache, obter_cache
+from extracao import extrair_texto_upload, resumo_extracao
+from maritaca import ErroMaritaca, configurado
+from memoria import obter_memoria
+from pdf_modulo import renderizar_pdf_modulo
+from pipeline import (
+    IDIOMAS,
+    ORDEM_SECOES,
+    SECOES,
+    chave_modulo,
+    criar_preprompt,
+    estimar_entrada,
+    montar_modulo,
+    preparar_faltantes,
+    refinar_secao,
+    secoes_prontas,
+    trabalho_modulo,
+)
+from trabalhos import CONCLUIDO, FALHOU, obter_gerenciador
+
+INTERVALO_ATUALIZACAO = 0.5
+# Campos mantidos enquanto a aba está fechada (ver app.manter_estado).
+CHAVES_ESTADO = (
+    "tema", "idioma", "opt_resumo", "opt_introducao", "opt_unidades", "opt_glossario", "opt_links",
+    "opt_conclusao", "opt_referencias", "opt_traduzir", "refinar_secao", "refinar_pedido",
+)
+
+
+def iniciar_geracao(texto_origem, file_hash, tema_geral, idioma, secoes_ids, mesclar=False, traduzir=True):
+    # A geração roda fora do script: reruns e cliques repetidos reencontram o
+    # mesmo trabalho pela chave do módulo (e pela opção de tradução, que muda
+    # o que ele produz). Com mesclar, as seções geradas entram no módulo
+    # atual (nova tentativa de seções que faltaram).
+    trabalho = obter_gerenciador().submeter(
+        chave_cache(chave_modulo(file_hash, tema_geral, idioma, secoes_ids), "traduzir" if traduzir else "gerar"),
+        trabalho_modulo(texto_origem, file_hash, tema_geral, idioma, secoes_ids, traduzir=traduzir),
     )
-    return chat_with_bot(prompt_glossario, preprompt)
+    st.session_state["escriba_trabalho"] = {"id": trabalho.id, "secoes": secoes_ids, "mesclar": mesclar}
 
-def gerar_links_anexos(conteudo, preprompt):
-    prompt_links = (
-        "Seção 4. Links de materiais complementares e anexos\n\n"
-        "Extraia apenas os links e anexos citados no texto. Conteúdo base:\n" + conteudo
-    )
-    return chat_with_bot(prompt_links, preprompt)
-
-def revisar_texto(conteudo, preprompt):
-    prompt_revisao = (
-        "Revisão ortográfica e de coerência\n\n"
-        "Revise o texto abaixo corrigindo erros ortográficos, gramaticais e problemas de coerência. "
-        "Mantenha o sentido original, melhore a fluidez e entregue apenas o texto revisado.\n\nTexto:\n"
-        + conteudo
-    )
-    return chat_with_bot(prompt_revisao, preprompt)
 
-def build_texto_final(secoes):
-    return "\n\n".join(secoes)
+@st.fragment(run_every=INTERVALO_ATUALIZACAO)
+def acompanhar_trabalho():
+    info = st.session_state["escriba_trabalho"]
+    trabalho = obter_gerenciador().obter(info["id"])
+    if trabalho is None:
+        del st.session_state["escriba_trabalho"]
+        st.warning("A geração em andamento não foi encontrada; gere o módulo novamente.")
+        return
+
+    estado = trabalho.instantaneo()
+    concluidas, total = estado["progresso"]
+    falhas = {secao_id: d["erro"] for secao_id, d in estado["detalhes"].items() if "erro" in d}
+    if estado["estado"] == CONCLUIDO:
+        del st.session_state["escriba_trabalho"]
+        conteudo, faltantes = estado["resultado"], falhas
+        if info.get("mesclar"):
+            conteudo = dict(ler_da_sessao("conteudo_modulo") or {}, **conteudo)
+            faltantes = {
+                secao_id: motivo for secao_id, motivo in (st.session_state.get("escriba_faltantes") or {}).items()
+                if secao_id not in info["secoes"]
+            }
+            faltantes.update(falhas)
+        else:
+            st.session_state.pop("escriba_conversa", None)
+        guardar_na_sessao("conteudo_modulo", conteudo)
+        st.session_state["escriba_faltantes"] = faltantes
+        st.session_state["escriba_aviso"] = (
+            "Geração concluída, mas algumas seções não foram geradas (veja abaixo)." if falhas else "Geração concluída."
+        )
+        st.rerun(scope="app")
+    if estado["estado"] == FALHOU:
+        del st.session_state["escriba_trabalho"]
+        st.error(
+            "A geração falhou; as seções concluídas ficaram no cache e serão "
+            f"reaproveitadas na próxima tentativa. {estado['erro']}"
+        )
+        return
+
+    st.progress(int(concluidas / total * 100) if total else 0)
+    st.caption(f"Gerando seções ({concluidas}/{total})…")
+    for secao_id in ORDEM_SECOES:
+        if secao_id in info["secoes"]:
+            st.markdown(f"**{SECOES[secao_id]['titulo']}**")
+            if secao_id in falhas:
+                st.warning(f"Seção não gerada: {falhas[secao_id]}")
+            else:
+                if "traduzida_de" in estado["detalhes"].get(secao_id, {}):
+                    st.caption(f"Traduzida da versão em {estado['detalhes'][secao_id]['traduzida_de']}.")
+                st.markdown(estado["parciais"].get(secao_id, ""))
 
 
 def escriba_ui():
 
-    if client is None:
+    if not configurado():
         st.error("A variável MARITACA_API_KEY não foi definida em .streamlit/secrets.toml.")
         return
 
     st.title("Escriba - Gerador de Módulo Educacional")
 
-    if "conteudo_modulo" not in st.session_state:
-        st.session_state["conteudo_modulo"] = []
-    if "texto_final" not in st.session_state:
-        st.session_state["texto_final"] = None
-    if "cache" not in st.session_state:
-        st.session_state["cache"] = {}
-
     arquivo = st.file_uploader("Envie um arquivo (.pdf, .txt, .docx)", type=["pdf", "txt", "docx"], key="arquivo")
 
     with st.form("generate_form"):
         st.header("Parâmetros")
         tema_geral = st.text_input("Digite uma breve descrição do tema geral:", key="tema")
-        idioma = st.selectbox("Idioma de saída", ["Português", "Inglês"], key="idioma")
+        idioma = st.selectbox("Idioma de saída", IDIOMAS, key="idioma")
 
         st.markdown("**Seções a gerar (marque as que desejar):**")
         gerar_resumo = st.checkbox("Resumo geral aprofundado (Seção 0)", value=False, key="opt_resumo")
@@ -118,6 +117,10 @@ def escriba_ui():
         gerar_links_opt = st.checkbox("Links e anexos (Seção 4)", value=True, key="opt_links")
         gerar_conclusao = st.checkbox("Conclusão (Seção 5)", value=True, key="opt_conclusao")
         gerar_referencias = st.checkbox("Referências (Seção 6)", value=True, key="opt_referencias")
+        traduzir = st.checkbox(
+            "Traduzir as seções já geradas em outro idioma, quando houver, em vez de gerá-las do material",
+            value=True, key="opt_traduzir"
+        )
 
         col1, col2 = st.columns([1, 1])
         with col1:
@@ -136,19 +139,26 @@ def escriba_ui():
             if ext != "pdf":
                 st.error("A revisão via PDF exige um arquivo .pdf. Para outros formatos, use a revisão de texto.")
             else:
-                file_bytes = arquivo.read()
-                file_like = BytesIO(file_bytes)
-                texto_pdf = ler_pdf(file_like)
-                preprompt = criar_preprompt(f"Tema geral: {tema_geral}\n\n{texto_pdf}", idioma)
-                revisado = revisar_texto(texto_pdf, preprompt)
-                st.success("Revisão do PDF concluída.")
-                st.text_area("Texto revisado (do PDF)", revisado, height=400)
-                st.download_button(
-                    "Baixar revisão (TXT)",
-                    revisado,
-                    file_name="revisao_pdf.txt",
-                    mime="text/plain"
-                )
+                # A revisão é a do Corretor, em blocos paralelos; o módulo só
+                # é importado quando ela é pedida (ver app.carregar_ui).
+                from Corretor import revisar_texto_em_blocos
+
+                extracao = extrair_texto_upload(arquivo.name, arquivo)
+                st.caption(resumo_extracao(extracao))
+                texto_pdf = extracao.texto
+                try:
+                    revisado = revisar_texto_em_blocos(texto_pdf, idioma)
+                except ErroMaritaca as e:
+                    st.error(str(e))
+                else:
+                    st.success("Revisão do PDF concluída.")
+                    st.text_area("Texto revisado (do PDF)", revisado, height=400)
+                    st.download_button(
+                        "Baixar revisão (TXT)",
+                        revisado,
+                        file_name="revisao_pdf.txt",
+                        mime="text/plain"
+                    )
 
     if 'gerar_btn' in locals() and gerar_btn:
         if not tema_geral and not arquivo:
@@ -156,232 +166,175 @@ def escriba_ui():
         else:
             if arquivo:
                 arquivo.seek(0)
-                file_bytes = arquivo.read()
-                file_hash = hashlib.sha256(file_bytes).hexdigest()
-                file_like = BytesIO(file_bytes)
-                ext = arquivo.name.split(".")[-1].lower()
-                if ext == "pdf":
-                    texto_origem = ler_pdf(file_like)
-                elif ext == "txt":
-                    texto_origem = ler_txt(file_like)
-                elif ext == "docx":
-                    texto_origem = ler_docx(file_like)
-                else:
+                try:
+                    extracao = extrair_texto_upload(arquivo.name, arquivo, identificar=True)
+                except ValueError:
                     st.error("Formato de arquivo não suportado.")
                     st.stop()
+                file_hash = extracao.hash_conteudo
+                texto_origem = extracao.texto
+                st.caption(resumo_extracao(extracao))
             else:
                 texto_origem = ""
 
-            preprompt = criar_preprompt(f"Tema geral: {tema_geral}\n\n{texto_origem}", idioma)
+            preprompt = criar_preprompt(f"Tema geral: {tema_geral}", idioma)
 
             if revisar_pdf_btn:
+                from Corretor import revisar_texto_em_blocos
+
                 conteudo_base = texto_origem if texto_origem.strip() else tema_geral
-                st.session_state["texto_revisado"] = revisar_texto(conteudo_base, preprompt)
+                texto_revisado = revisar_texto_em_blocos(conteudo_base, idioma)
                 st.success("Revisão concluída.")
-                st.text_area("Texto revisado", st.session_state["texto_revisado"], height=300)
+                st.text_area("Texto revisado", texto_revisado, height=300)
                 st.download_button(
                     "Baixar revisão (TXT)",
-                    st.session_state["texto_revisado"],
+                    texto_revisado,
                     file_name="texto_revisado.txt",
                     mime="text/plain",
                     key="download-revisado"
                 )
 
             if gerar_btn:
-                if not any([gerar_resumo, gerar_introducao, gerar_unidades, gerar_glossario_opt, gerar_links_opt, gerar_conclusao, gerar_referencias]):
+                secoes_selecionadas = [
+                    secao_id for secao_id, marcada in [
+                        ("resumo", gerar_resumo),
+                        ("introducao", gerar_introducao),
+                        ("unidades", gerar_unidades),
+                        ("glossario", gerar_glossario_opt),
+                        ("links", gerar_links_opt),
+                        ("conclusao", gerar_conclusao),
+                        ("referencias", gerar_referencias),
+                    ] if marcada
+                ]
+                if not secoes_selecionadas:
                     st.error("Selecione ao menos uma seção para gerar.")
+                    st.stop()
+
+                file_hash_modulo = file_hash if arquivo else None
+                # Inclui as seções que as etapas locais resolvem sem API.
+                em_cache = secoes_prontas(texto_origem, file_hash_modulo, tema_geral, idioma, secoes_selecionadas)
+                faltantes = [secao_id for secao_id in secoes_selecionadas if secao_id not in em_cache]
+
+                # Para gerar de novo, depois, só as seções que faltarem.
+                st.session_state["escriba_origem"] = {
+                    "file_hash": file_hash_modulo, "tema": tema_geral, "idioma": idioma, "traduzir": traduzir
+                }
+                guardar_na_sessao("escriba_texto_origem", texto_origem or None)
+                st.session_state.pop("escriba_faltantes", None)
+
+                if not faltantes:
+                    st.success("Conteúdo carregado do cache ou extraído do material, sem chamadas à API.")
+                    guardar_na_sessao("conteudo_modulo", em_cache)
+                    st.session_state.pop("escriba_conversa", None)
                 else:
-                    opts = [
-                        ("R" if gerar_resumo else "-"),
-                        ("I" if gerar_introducao else "-"),
-                        ("U" if gerar_unidades else "-"),
-                        ("G" if gerar_glossario_opt else "-"),
-                        ("L" if gerar_links_opt else "-"),
-                        ("C" if gerar_conclusao else "-"),
-                        ("F" if gerar_referencias else "-"),
-                    ]
-                    opts_tag = "".join(opts)
-                cache_key = f"{file_hash if arquivo else 'no_file'}__{tema_geral.strip()}__{idioma}__{opts_tag}"
-
-                if cache_key in st.session_state["cache"]:
-                    st.success("Conteúdo carregado do cache.")
-                    st.session_state["texto_final"] = st.session_state["cache"][cache_key]
-                else:
-                    st.session_state["conteudo_modulo"] = []
-                    progress = st.progress(0)
-                    step = 0
-                    total_steps = 1 + sum([gerar_resumo, gerar_introducao, gerar_unidades, gerar_glossario_opt, gerar_links_opt, gerar_conclusao, gerar_referencias])
-                    step += 1
-                    progress.progress(int(step / total_steps * 100))
-
-                    if gerar_resumo:
-                        prompt_resumo = (
-                            "Seção 0. Resumo geral aprofundado\n\n"
-                            "Faça um resumo aprofundado do material, sintetizando os pontos principais e destacando aplicações práticas."
-                        )
-                        conteudo_resumo = chat_with_bot(prompt_resumo, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 0. Resumo geral aprofundado\n" + conteudo_resumo)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_introducao:
-                        prompt_introducao = (
-                            "Seção 1. Introdução ao conteúdo\n\n"
-                            "Redija um texto introdutório para um módulo educacional com pelo menos 3 parágrafos."
+                    contextos, traducao = preparar_faltantes(
+                        faltantes, texto_origem, file_hash_modulo, tema_geral, idioma, traduzir
+                    )
+                    estimativas = estimar_entrada(faltantes, preprompt, tema_geral, contextos, traducao)
+                    st.caption(
+                        f"Entrada estimada: ~{sum(estimativas.values())} tokens em {len(estimativas)} chamadas ("
+                        + ", ".join(f"{SECOES[s]['tag']}: ~{t}" for s, t in estimativas.items())
+                        + ")."
+                        + (f" {len(em_cache)} seção(ões) já pronta(s), do cache ou do material." if em_cache else "")
+                        + (
+                            f" {len(traducao[1])} seção(ões) traduzida(s) da versão em {traducao[0]}, "
+                            "sem reler o material."
+                            if traducao else ""
                         )
-                        conteudo_introducao = chat_with_bot(prompt_introducao, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 1. Introdução ao conteúdo\n" + conteudo_introducao)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_unidades:
-                        prompt_unidades = "Seção 2. Unidades de aprendizagem do Módulo\n\nDesenvolva as unidades principais."
-                        conteudo_unidades = chat_with_bot(prompt_unidades, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 2. Unidades de aprendizagem do Módulo\n" + conteudo_unidades)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_glossario_opt:
-                        conteudo_para_glossario = f"{tema_geral}\n{texto_origem}"
-                        conteudo_glossario = gerar_glossario(conteudo_para_glossario, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 3. Glossário geral\n" + conteudo_gllossario if False else "Seção 3. Glossário geral\n" + conteudo_glossario)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_links_opt:
-                        conteudo_links = gerar_links_anexos(texto_origem, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 4. Links de materiais complementares e anexos\n" + conteudo_links)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_conclusao:
-                        prompt_conclusao = "Seção 5. Unidade de conclusão do módulo\n\nResuma e incentive a aplicação do conhecimento."
-                        conteudo_conclusao = chat_with_bot(prompt_conclusao, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 5. Unidade de conclusão do módulo\n" + conteudo_conclusao)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    if gerar_referencias:
-                        prompt_referencias = "Seção 6. Referências do Módulo\n\nExtraia referências presentes no conteúdo."
-                        conteudo_referencias = chat_with_bot(prompt_referencias, preprompt)
-                        st.session_state["conteudo_modulo"].append("Seção 6. Referências do Módulo\n" + conteudo_referencias)
-                        step += 1
-                        progress.progress(int(step / total_steps * 100))
-
-                    texto_final = build_texto_final(st.session_state["conteudo_modulo"])
-                    st.session_state["texto_final"] = texto_final
-                    st.session_state["cache"][cache_key] = texto_final
-                    progress.progress(100)
-                    st.success("Geração concluída.")
-
-    if st.session_state.get("texto_final"):
-        st.markdown("---")
-        texto_final = st.session_state["texto_final"]
-
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        from reportlab.lib.styles import ParagraphStyle
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
-        from reportlab.platypus import PageBreak
-
-        buffer_pdf = BytesIO()
-        doc_pdf = SimpleDocTemplate(
-            buffer_pdf,
-            pagesize=A4,
-            rightMargin=48,
-            leftMargin=48,
-            topMargin=56,
-            bottomMargin=56,
-        )
+                    )
+                    iniciar_geracao(
+                        texto_origem, file_hash_modulo, tema_geral, idioma, secoes_selecionadas, traduzir=traduzir
+                    )
+
+    if st.session_state.get("escriba_trabalho"):
+        acompanhar_trabalho()
 
-        base_font = "Helvetica"
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(
-            name="TitleMain",
-            parent=styles["Title"],
-            fontName=base_font,
-            fontSize=20,
-            leading=24,
-            alignment=TA_CENTER,
-            spaceAfter=18,
-        ))
-        styles.add(ParagraphStyle(
-            name="ModuleMeta",
-            parent=styles["Normal"],
-            fontName=base_font,
-            fontSize=10,
-            leading=12,
-            alignment=TA_CENTER,
-            textColor="#666666",
-            spaceAfter=12,
-        ))
-        styles.add(ParagraphStyle(
-            name="HeadingSection",
-            parent=styles["Heading2"],
-            fontName=base_font,
-            fontSize=14,
-            leading=18,
-            spaceBefore=12,
-            spaceAfter=6,
-        ))
-        styles.add(ParagraphStyle(
-            name="EscribaBody",
-            parent=styles["Normal"],
-            fontName=base_font,
-            fontSize=11,
-            leading=15,
-            spaceBefore=6,
-            spaceAfter=6,
-            alignment=TA_LEFT,
-        ))
-        styles.add(ParagraphStyle(
-            name="FooterSmall",
-            parent=styles["Normal"],
-            fontName=base_font,
-            fontSize=8,
-            leading=10,
-            alignment=TA_CENTER,
-            textColor="#777777",
-        ))
-
-        def draw_page(canvas, doc):
-            canvas.saveState()
-            w, h = A4
-            footer_text = "Escriba — Gerador de Módulo Educacional"
-            page_num = f"Página {doc.page}"
-            canvas.setFont(base_font, 8)
-            canvas.setFillColorRGB(0.4, 0.4, 0.4)
-            canvas.drawCentredString(w / 2.0, 20, footer_text + "    •    " + page_num)
-            canvas.restoreState()
-
-        story = []
+    if st.session_state.get("escriba_aviso"):
+        st.success(st.session_state.pop("escriba_aviso"))
+
+    # A sessão guarda só o identificador; o módulo fica no armazém do processo.
+    conteudo_modulo = ler_da_sessao("conteudo_modulo")
+    if conteudo_modulo is None and st.session_state.get("conteudo_modulo"):
+        st.session_state["conteudo_modulo"] = None
+        st.info("O módulo gerado saiu da memória do servidor; gere-o novamente (as seções vêm do cache).")
+
+    faltantes_modulo = st.session_state.get("escriba_faltantes") or {}
+    if conteudo_modulo is not None and (conteudo_modulo or faltantes_modulo):
+        st.markdown("---")
+        texto_final = montar_modulo(conteudo_modulo, faltantes_modulo)
+
+        if faltantes_modulo:
+            st.warning(
+                "Módulo parcial: as seções abaixo não foram geradas e aparecem marcadas no PDF. "
+                "As demais já estão prontas e no cache."
+            )
+            for secao_id in [s for s in ORDEM_SECOES if s in faltantes_modulo]:
+                col_secao, col_botao = st.columns([3, 1])
+                col_secao.caption(f"{SECOES[secao_id]['titulo']}: {faltantes_modulo[secao_id]}")
+                if col_botao.button("Gerar novamente", key=f"retentar-{secao_id}",
+                                    disabled=bool(st.session_state.get("escriba_trabalho"))):
+                    origem = st.session_state.get("escriba_origem")
+                    texto_origem = ler_da_sessao("escriba_texto_origem") or ""
+                    if origem is None or (origem["file_hash"] and not texto_origem):
+                        st.info("O material de base saiu da memória do servidor; gere o módulo novamente.")
+                    else:
+                        iniciar_geracao(
+                            texto_origem, origem["file_hash"], origem["tema"], origem["idioma"], [secao_id],
+                            mesclar=True, traduzir=origem.get("traduzir", True),
+                        )
+                        st.rerun()
 
         titulo_modulo = st.session_state.get("tema", "Módulo Gerado")
         idioma_meta = st.session_state.get("idioma", "Português")
-        from datetime import datetime
-        story.append(Paragraph("Escriba — Gerador de Módulo", styles["TitleMain"]))
-        story.append(Paragraph(titulo_modulo, styles["HeadingSection"]))
-        meta = f"Idioma: {idioma_meta} • Gerado: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
-        story.append(Paragraph(meta, styles["ModuleMeta"]))
-        story.append(Spacer(1, 0.2 * inch))
-        story.append(PageBreak())
-
-        for sec in [s.strip() for s in texto_final.split("\n\n") if s.strip()]:
-            linhas = sec.split("\n")
-            heading = linhas[0].strip()
-            body_lines = linhas[1:]
-            story.append(Paragraph(heading, styles["HeadingSection"]))
-            body_text = "\n".join(body_lines).strip()
-            if body_text:
-                paras = [p.strip() for p in body_text.split("\n\n") if p.strip()]
-                for p in paras:
-                    story.append(Paragraph(p.replace("\n", "<br/>"), styles["EscribaBody"]))
-            story.append(Spacer(1, 0.12 * inch))
-
-        doc_pdf.build(story, onFirstPage=draw_page, onLaterPages=draw_page)
-        buffer_pdf.seek(0)
-
-        st.download_button("Baixar PDF do módulo", buffer_pdf, "modulo.pdf", "application/pdf", key="download-pdf")
+
+        # Só renderiza quando o download é pedido; o resultado fica
+        # memoizado por hash de texto_final + tema + idioma.
+        st.download_button(
+            "Baixar PDF do módulo",
+            lambda: renderizar_pdf_modulo(texto_final, titulo_modulo, idioma_meta),
+            "modulo.pdf",
+            "application/pdf",
+            key="download-pdf"
+        )
+
+        with st.expander("Refinar módulo"):
+            # Cada módulo gerado abre uma conversa nova; os pedidos
+            # anteriores seguem como contexto dos próximos.
+            conversa_id = st.session_state.setdefault("escriba_conversa", uuid.uuid4().hex)
+            with st.form("refinar_form"):
+                secao_alvo = st.selectbox(
+                    "Seção",
+                    [secao_id for secao_id in ORDEM_SECOES if secao_id in conteudo_modulo],
+                    format_func=lambda secao_id: SECOES[secao_id]["titulo"],
+                    key="refinar_secao"
+                )
+                pedido = st.text_input(
+                    "Ajuste desejado (ex.: encurte a unidade 2, acrescente exemplos):", key="refinar_pedido"
+                )
+                refinar_btn = st.form_submit_button("Aplicar ajuste")
+            if refinar_btn and pedido.strip() and secao_alvo:
+                try:
+                    novo_texto = refinar_secao(
+                        conversa_id, secao_alvo, conteudo_modulo[secao_alvo], pedido.strip(),
+                        titulo_modulo, idioma_meta
+                    )
+                except ErroMaritaca as e:
+                    st.error(f"O ajuste falhou. {e}")
+                else:
+                    conteudo_modulo[secao_alvo] = novo_texto
+                    guardar_na_sessao("conteudo_modulo", conteudo_modulo)
+                    st.session_state["escriba_aviso"] = f"{SECOES[secao_alvo]['titulo']} ajustada."
+                    st.rerun()
+            _resumo, pedidos = obter_memoria().historico(conversa_id)
+            for mensagem in pedidos:
+                if mensagem["role"] == "user":
+                    st.caption(f"• {mensagem['content']}")
+
+        stats_cache = obter_cache().estatisticas()
+        st.caption(
+            f"Cache compartilhado: {stats_cache['hits_memoria'] + stats_cache['hits_disco']} acertos, "
+            f"{stats_cache['misses']} falhas ({stats_cache['taxa_acerto']:.0%})."
+        )
 
         st.markdown(
             "<div style='position: fixed; bottom: 8px; right: 16px; font-size: 10px; color: #888;'>"
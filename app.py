@@ -1,17 +1,79 @@
+import importlib
+import sys
+
 import streamlit as st
 
+from metricas import medir
+
 st.set_page_config(page_title="Escriba + Corretor", layout="wide")
 
 st.markdown("# Escriba + Corretor")
 st.markdown("Escolha a aba para usar o gerador de módulos (Escriba) ou o corretor de texto.")
 
-from Escriba import escriba_ui
-from Corretor import corretor_ui
 
-tab_escriba, tab_corretor = st.tabs(["Escriba", "Corretor"])
+def carregar_ui(modulo):
+    # Cada aba é importada na primeira vez que é aberta; o tempo fica nas
+    # métricas ("importacao").
+    if modulo not in sys.modules:
+        with medir("importacao", modulo=modulo):
+            importlib.import_module(modulo)
+    return sys.modules[modulo]
+
+
+def manter_estado(modulo):
+    # Widgets que não são desenhados numa execução perdem o valor; reatribuir
+    # mantém o que foi preenchido na aba fechada.
+    for chave in getattr(sys.modules.get(modulo), "CHAVES_ESTADO", ()):
+        if chave in st.session_state:
+            st.session_state[chave] = st.session_state[chave]
+
+
+# Só a aba aberta é montada a cada execução.
+tab_escriba, tab_corretor = st.tabs(["Escriba", "Corretor"], key="aba", on_change="rerun")
+
+if tab_escriba.open:
+    with tab_escriba:
+        carregar_ui("Escriba").escriba_ui()
+else:
+    manter_estado("Escriba")
+
+if tab_corretor.open:
+    with tab_corretor:
+        carregar_ui("Corretor").corretor_ui()
+else:
+    manter_estado("Corretor")
 
-with tab_escriba:
-    escriba_ui()
+with st.sidebar:
+    if st.checkbox("Mostrar métricas de desempenho"):
+        from metricas import snapshot, snapshot_json
 
-with tab_corretor:
-    corretor_ui()
+        dados = snapshot()
+        grupos = dados["grupos"]
+        if grupos:
+            st.dataframe(
+                [
+                    {
+                        "tipo": g["tipo"],
+                        "nome": g["nome"],
+                        "chamadas": g["chamadas"],
+                        "erros": g["erros"],
+                        "duplicadas": g["duplicadas"],
+                        "p50 (s)": g["p50"],
+                        "p95 (s)": g["p95"],
+                        "tokens entrada": g["tokens_entrada"],
+                        "tokens saída": g["tokens_saida"],
+                        "cache": ", ".join(f"{k}: {v}" for k, v in sorted(g["cache"].items())),
+                    }
+                    for g in grupos
+                ],
+                hide_index=True,
+            )
+            st.download_button(
+                "Exportar métricas (JSON)",
+                snapshot_json(dados),
+                file_name="metricas.json",
+                mime="application/json",
+                key="exportar_metricas",
+            )
+        else:
+            st.caption("Nenhuma métrica registrada ainda.")
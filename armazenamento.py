@@ -0,0 +1,195 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from configuracao import obter_config
+
+# Textos grandes e resultados ficam aqui, no processo, e o session_state de
+# cada sessão guarda só o identificador. Acima do teto de memória os itens
+# menos usados vão para arquivos temporários; acima do teto de disco, do teto
+# por sessão ou sem acesso há ARMAZEM_TTL segundos, são descartados.
+MAX_BYTES_MEMORIA = int(obter_config("ESCRIBA_ARMAZEM_MAX_BYTES_MEMORIA", 256 * 1024 * 1024))
+MAX_BYTES_DISCO = int(obter_config("ESCRIBA_ARMAZEM_MAX_BYTES_DISCO", 2 * 1024 * 1024 * 1024))
+MAX_BYTES_SESSAO = int(obter_config("ESCRIBA_ARMAZEM_MAX_BYTES_SESSAO", 32 * 1024 * 1024))
+ARMAZEM_TTL = float(obter_config("ESCRIBA_ARMAZEM_TTL", 2 * 3600))
+
+
+class Armazem:
+
+    def __init__(self, max_bytes_memoria=MAX_BYTES_MEMORIA, max_bytes_disco=MAX_BYTES_DISCO,
+                 max_bytes_sessao=MAX_BYTES_SESSAO, ttl=ARMAZEM_TTL, pasta=None):
+        self.max_bytes_memoria = max_bytes_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self.max_bytes_sessao = max_bytes_sessao
+        self.ttl = ttl
+        self._pasta = pasta
+        self._itens = OrderedDict()
+        self._bytes_sessao = defaultdict(int)
+        self._bytes_memoria = 0
+        self._bytes_disco = 0
+        self._contadores = {"gravacoes": 0, "derramados": 0, "descartados": 0, "expirados": 0}
+        self._lock = threading.Lock()
+
+    def _caminho(self, handle):
+        if self._pasta is None:
+            self._pasta = tempfile.mkdtemp(prefix="escriba-armazem-")
+            atexit.register(shutil.rmtree, self._pasta, True)
+        return os.path.join(self._pasta, handle)
+
+    def guardar(self, sessao_id, valor):
+        if isinstance(valor, str):
+            tipo, dados = "texto", valor.encode("utf-8")
+        else:
+            tipo, dados = "json", json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._expirar()
+            self._itens[handle] = {
+                "sessao": sessao_id, "tipo": tipo, "tamanho": len(dados),
+                "dados": dados, "caminho": None, "acesso": time.time(),
+            }
+            self._bytes_memoria += len(dados)
+            self._bytes_sessao[sessao_id] += len(dados)
+            self._contadores["gravacoes"] += 1
+            self._limitar_sessao(sessao_id, handle)
+            self._limitar_memoria()
+            self._limitar_disco()
+        return handle
+
+    def obter(self, handle):
+        # None se o item foi liberado, expirou ou foi descartado por espaço.
+        with self._lock:
+            item = self._itens.get(handle)
+            if item is None:
+                return None
+            self._itens.move_to_end(handle)
+            item["acesso"] = time.time()
+            dados = item["dados"]
+            if dados is None:
+                with open(item["caminho"], "rb") as arquivo:
+                    dados = arquivo.read()
+            tipo = item["tipo"]
+        texto = dados.decode("utf-8")
+        return texto if tipo == "texto" else json.loads(texto)
+
+    def contem(self, handle):
+        with self._lock:
+            return handle in self._itens
+
+    def liberar(self, handle):
+        with self._lock:
+            if handle in self._itens:
+                self._descartar(handle)
+
+    def liberar_sessao(self, sessao_id):
+        with self._lock:
+            for handle in [h for h, item in self._itens.items() if item["sessao"] == sessao_id]:
+                self._descartar(handle)
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(
+                self._contadores,
+                itens=len(self._itens),
+                sessoes=len(self._bytes_sessao),
+                bytes_memoria=self._bytes_memoria,
+                bytes_disco=self._bytes_disco,
+            )
+
+    def _descartar(self, handle, motivo=None):
+        item = self._itens.pop(handle)
+        if item["dados"] is None:
+            self._bytes_disco -= item["tamanho"]
+            try:
+                os.remove(item["caminho"])
+            except OSError:
+                pass
+        else:
+            self._bytes_memoria -= item["tamanho"]
+        self._bytes_sessao[item["sessao"]] -= item["tamanho"]
+        if self._bytes_sessao[item["sessao"]] <= 0:
+            del self._bytes_sessao[item["sessao"]]
+        if motivo:
+            self._contadores[motivo] += 1
+
+    def _derramar(self, handle):
+        item = self._itens[handle]
+        caminho = self._caminho(handle)
+        with open(caminho, "wb") as arquivo:
+            arquivo.write(item["dados"])
+        item["dados"] = None
+        item["caminho"] = caminho
+        self._bytes_memoria -= item["tamanho"]
+        self._bytes_disco += item["tamanho"]
+        self._contadores["derramados"] += 1
+
+    def _limitar_sessao(self, sessao_id, protegido):
+        # Os itens mais antigos da sessão saem primeiro; o recém-gravado fica.
+        while self._bytes_sessao[sessao_id] > self.max_bytes_sessao:
+            antigo = next((h for h, item in self._itens.items() if item["sessao"] == sessao_id and h != protegido), None)
+            if antigo is None:
+                break
+            self._descartar(antigo, "descartados")
+
+    def _limitar_memoria(self):
+        while self._bytes_memoria > self.max_bytes_memoria:
+            antigo = next((h for h, item in self._itens.items() if item["dados"] is not None), None)
+            if antigo is None:
+                break
+            self._derramar(antigo)
+
+    def _limitar_disco(self):
+        while self._bytes_disco > self.max_bytes_disco:
+            antigo = next((h for h, item in self._itens.items() if item["dados"] is None), None)
+            if antigo is None:
+                break
+            self._descartar(antigo, "descartados")
+
+    def _expirar(self):
+        limite = time.time() - self.ttl
+        # A ordem é de uso (LRU): os expirados estão todos no começo.
+        while self._itens:
+            handle, item = next(iter(self._itens.items()))
+            if item["acesso"] >= limite:
+                break
+            self._descartar(handle, "expirados")
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem():
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            _armazem = Armazem()
+        return _armazem
+
+
+def _sessao_id():
+    import streamlit as st
+    return st.session_state.setdefault("armazem_sessao", uuid.uuid4().hex)
+
+
+def guardar_na_sessao(nome, valor):
+    # Troca o valor referenciado por st.session_state[nome], liberando o
+    # anterior. None apenas remove.
+    import streamlit as st
+    armazem = obter_armazem()
+    anterior = st.session_state.get(nome)
+    if anterior:
+        armazem.liberar(anterior)
+    st.session_state[nome] = armazem.guardar(_sessao_id(), valor) if valor is not None else None
+
+
+def ler_da_sessao(nome):
+    import streamlit as st
+    handle = st.session_state.get(nome)
+    return obter_armazem().obter(handle) if handle else None
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from stub_maritaca import ConfigStub, iniciar_stub  # noqa: E402
+
+# Teste de carga: N sessões simuladas do app.py (AppTest) no mesmo processo,
+# contra o stub local, subindo N por níveis. As sessões compartilham o que um
+# servidor Streamlit compartilha (trabalhos, semáforo da API, cache, armazém).
+# O AppTest não roda dois scripts ao mesmo tempo num processo (o Runtime dele
+# é global), então as execuções do script passam uma de cada vez por uma
+# trava; "script" é o tempo dentro dela e "espera", o tempo na fila. Cada
+# atualização refaz o script inteiro, enquanto no navegador só o fragmento
+# de acompanhamento roda: o custo por sessão aqui é um teto.
+INTERVALO_ATUALIZACAO = 0.5
+PARAGRAFO = (
+    "O período colonial brasileiro teve início em 1500 e se estendeu até a Independência, em 1822. "
+    "A economia colonial se apoiou no latifúndio, na monocultura e no trabalho escravizado."
+)
+
+_trava_script = threading.Lock()
+
+
+def memoria_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, -(-len(ordenados) * p // 100) - 1)]
+
+
+class Sessao:
+    # Um usuário simulado: uma instância de AppTest e as medições dela.
+
+    def __init__(self, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=timeout)
+        self.timeout = timeout
+        self.scripts = []
+        self.esperas = []
+        self.operacoes = []
+        self.erros = []
+
+    def executar(self, acao=None):
+        chegada = time.perf_counter()
+        with _trava_script:
+            inicio = time.perf_counter()
+            if acao is not None:
+                acao(self.app)
+            self.app.run()
+            fim = time.perf_counter()
+        self.esperas.append(inicio - chegada)
+        self.scripts.append(fim - inicio)
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].value)
+
+    def abrir_aba(self, aba):
+        if ("aba" in self.app.session_state and self.app.session_state["aba"] or "Escriba") != aba:
+            self.executar(lambda app: app.session_state.__setitem__("aba", aba))
+
+    def aguardar(self, chave_trabalho, chave_resultado):
+        # Atualiza como o fragmento de acompanhamento até o trabalho terminar.
+        limite = time.perf_counter() + self.timeout
+        estado = self.app.session_state
+        while chave_trabalho in estado and estado[chave_trabalho] or not (
+            chave_resultado in estado and estado[chave_resultado]
+        ):
+            if time.perf_counter() > limite:
+                raise TimeoutError(f"{chave_resultado} não ficou pronto em {self.timeout:.0f}s")
+            time.sleep(INTERVALO_ATUALIZACAO)
+            self.executar()
+
+    def escriba(self):
+        # Gera um módulo com tema inédito (sem cache) e baixa o PDF.
+        import pdf_modulo
+        import pipeline
+        from armazenamento import obter_armazem
+
+        tema = f"Carga {uuid.uuid4().hex[:8]}"
+
+        def gerar(app):
+            app.text_input(key="tema").input(tema)
+            app.button[0].click()
+
+        inicio = time.perf_counter()
+        self.abrir_aba("Escriba")
+        self.executar(gerar)
+        self.aguardar("escriba_trabalho", "conteudo_modulo")
+        gerado = time.perf_counter()
+        conteudo = obter_armazem().obter(self.app.session_state["conteudo_modulo"])
+        faltantes = self.app.session_state["escriba_faltantes"] if "escriba_faltantes" in self.app.session_state else {}
+        pdf_modulo.renderizar_pdf_modulo(pipeline.montar_modulo(conteudo, faltantes), tema, "Português")
+        fim = time.perf_counter()
+        self.operacoes.append({"tipo": "escriba", "segundos": fim - inicio, "segundos_pdf": fim - gerado})
+
+    def corretor(self, paragrafos):
+        # Revisa um texto inédito (sem cache de parágrafos).
+        marca = uuid.uuid4().hex[:8]
+        texto = "\n\n".join(f"{marca}-{i}. {PARAGRAFO}" for i in range(paragrafos))
+
+        def revisar(app):
+            app.text_area(key="corretor_texto_colado").input(texto)
+            app.button(key="corretor_revisar").click()
+
+        inicio = time.perf_counter()
+        self.abrir_aba("Corretor")
+        self.executar(revisar)
+        self.aguardar("corretor_trabalho", "corretor_texto_revisado")
+        self.operacoes.append({"tipo": "corretor", "segundos": time.perf_counter() - inicio})
+
+
+def simular(indice, cenario, iteracoes, paragrafos, timeout, sessoes):
+    sessao = Sessao(timeout)
+    sessoes.append(sessao)
+    try:
+        sessao.executar()
+        for iteracao in range(iteracoes):
+            tipo = cenario if cenario != "misto" else ("escriba", "corretor")[(indice + iteracao) % 2]
+            try:
+                if tipo == "escriba":
+                    sessao.escriba()
+                else:
+                    sessao.corretor(paragrafos)
+            except (RuntimeError, TimeoutError, KeyError) as erro:
+                sessao.erros.append(f"{tipo}: {erro}")
+    except RuntimeError as erro:
+        sessao.erros.append(f"abertura: {erro}")
+
+
+def nivel(n, args, config):
+    from armazenamento import obter_armazem
+
+    requisicoes_antes = config.contadores["requisicoes"]
+    memoria_antes = memoria_rss()
+    sessoes = []
+    threads = [
+        threading.Thread(target=simular, args=(i, args.cenario, args.iteracoes, args.paragrafos, args.timeout, sessoes))
+        for i in range(n)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    segundos = time.perf_counter() - inicio
+    memoria_depois = memoria_rss()
+    armazem = obter_armazem().estatisticas()
+
+    operacoes = [op for s in sessoes for op in s.operacoes]
+    erros = [erro for s in sessoes for erro in s.erros]
+    latencias = [op["segundos"] for op in operacoes]
+    scripts = [t for s in sessoes for t in s.scripts]
+    esperas = [t for s in sessoes for t in s.esperas]
+    resultado = {
+        "sessoes": n,
+        "segundos": round(segundos, 3),
+        "operacoes": len(operacoes),
+        "erros": len(erros),
+        "vazao_por_minuto": round(len(operacoes) / segundos * 60, 2),
+        "latencia": {f"p{p}": percentil(latencias, p) for p in (50, 95, 99)},
+        "script": {f"p{p}": percentil(scripts, p) for p in (50, 95)},
+        "espera_script": {f"p{p}": percentil(esperas, p) for p in (50, 95)},
+        "pdf_p95": percentil([op["segundos_pdf"] for op in operacoes if "segundos_pdf" in op], 95),
+        "requisicoes_api": config.contadores["requisicoes"] - requisicoes_antes,
+        "memoria_por_sessao_bytes": max(0, memoria_depois - memoria_antes) // n,
+        "rss_bytes": memoria_depois,
+        "armazem_bytes": armazem["bytes_memoria"] + armazem["bytes_disco"],
+        "exemplos_erros": erros[:3],
+    }
+    # A próxima rodada começa do zero no armazém, como sessões encerradas.
+    for sessao in sessoes:
+        if "armazem_sessao" in sessao.app.session_state:
+            obter_armazem().liberar_sessao(sessao.app.session_state["armazem_sessao"])
+    return resultado
+
+
+def ponto_de_quebra(niveis, fator, taxa_erros):
+    # Primeiro nível em que a vazão para de crescer, o p95 passa de fator × o
+    # p95 de uma sessão ou os erros passam da taxa; devolve (nível, motivo).
+    base = niveis[0]["latencia"]["p95"] if niveis else None
+    for anterior, atual in zip([None] + niveis, niveis):
+        total = atual["operacoes"] + atual["erros"]
+        if total and atual["erros"] / total > taxa_erros:
+            return atual["sessoes"], f"erros em {atual['erros']}/{total} operações"
+        if base and atual["latencia"]["p95"] and atual["latencia"]["p95"] > fator * base:
+            return atual["sessoes"], f"p95 {atual['latencia']['p95']:.2f}s > {fator:g} × {base:.2f}s"
+        if anterior and atual["vazao_por_minuto"] < 1.1 * anterior["vazao_por_minuto"]:
+            return atual["sessoes"], (
+                f"vazão {atual['vazao_por_minuto']:.1f}/min, sem ganho sobre {anterior['vazao_por_minuto']:.1f}/min"
+            )
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Teste de carga do app.py: sessões simuladas (AppTest) em paralelo contra um stub local."
+    )
+    parser.add_argument("--sessoes", default="1,2,4,8,16", help="Níveis de sessões simultâneas.")
+    parser.add_argument("--cenario", default="misto", choices=["misto", "escriba", "corretor"])
+    parser.add_argument("--iteracoes", type=int, default=2, help="Operações por sessão em cada nível.")
+    parser.add_argument("--paragrafos", type=int, default=6, help="Parágrafos do texto enviado ao Corretor.")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Limite por operação, em segundos.")
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0)
+    parser.add_argument("--tokens-resposta", type=int, default=150)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--fator-quebra", type=float, default=3.0,
+                        help="Quantas vezes o p95 de uma sessão conta como colapso.")
+    parser.add_argument("--taxa-erros", type=float, default=0.05)
+    parser.add_argument("--saida", help="Grava o JSON neste arquivo em vez da saída padrão.")
+    args = parser.parse_args()
+
+    config = ConfigStub(latencia=args.latencia, tokens_por_segundo=args.tokens_por_segundo,
+                        tokens_resposta=args.tokens_resposta, taxa_429=args.taxa_429, retry_after=0.05, semente=42)
+    servidor, base_url = iniciar_stub(config)
+    pasta = tempfile.mkdtemp(prefix="escriba-carga-")
+    # Antes de importar os módulos do app, que leem a configuração na importação.
+    os.environ.update({
+        "MARITACA_BASE_URL": base_url,
+        "MARITACA_API_KEY": "carga",
+        "MARITACA_BACKOFF_BASE": "0.05",
+        "ESCRIBA_CACHE_PATH": os.path.join(pasta, "cache.sqlite3"),
+        "ESCRIBA_MEMORIA_PATH": os.path.join(pasta, "memoria.jsonl"),
+    })
+
+    # Aquecimento: importações e caches de fontes ficam fora das medições.
+    simular(0, args.cenario if args.cenario != "misto" else "escriba", 1, args.paragrafos, args.timeout, [])
+    if args.cenario == "misto":
+        simular(0, "corretor", 1, args.paragrafos, args.timeout, [])
+
+    niveis = []
+    for n in [int(valor) for valor in args.sessoes.split(",") if valor.strip()]:
+        resultado = nivel(n, args, config)
+        niveis.append(resultado)
+        print(
+            f"{n:>4} sessões: {resultado['vazao_por_minuto']:>7.1f} op/min, "
+            f"p50 {resultado['latencia']['p50'] or 0:.2f}s, p95 {resultado['latencia']['p95'] or 0:.2f}s, "
+            f"script p95 {resultado['script']['p95'] or 0:.3f}s, espera p95 {resultado['espera_script']['p95'] or 0:.3f}s, "
+            f"{resultado['memoria_por_sessao_bytes'] / 1024 / 1024:.1f} MiB/sessão, {resultado['erros']} erros",
+            file=sys.stderr,
+        )
+    servidor.shutdown()
+
+    quebra, motivo = ponto_de_quebra(niveis, args.fator_quebra, args.taxa_erros)
+    print(f"Ponto de quebra: {quebra} sessões ({motivo})" if quebra else "Sem ponto de quebra nos níveis testados.",
+          file=sys.stderr)
+    saida = {
+        "meta": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "cenario": args.cenario,
+            "iteracoes": args.iteracoes,
+            "stub": {"latencia": args.latencia, "tokens_por_segundo": args.tokens_por_segundo,
+                     "tokens_resposta": args.tokens_resposta, "taxa_429": args.taxa_429, **config.contadores},
+        },
+        "niveis": niveis,
+        "ponto_de_quebra": {"sessoes": quebra, "motivo": motivo},
+    }
+    texto = json.dumps(saida, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from io import BytesIO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from stub_maritaca import ConfigStub, iniciar_stub  # noqa: E402
+
+PARAGRAFO = (
+    "O período colonial brasileiro teve início em 1500 e se estendeu até a Independência, em 1822. "
+    "A economia colonial se apoiou no latifúndio, na monocultura e no trabalho escravizado, e a "
+    "descoberta de ouro em Minas Gerais deslocou o eixo econômico para o Sudeste. Veja também "
+    "https://exemplo.org/colonia e o Anexo I para a cronologia completa."
+)
+
+
+def texto_sintetico(caracteres):
+    paragrafos = []
+    total = 0
+    indice = 0
+    while total < caracteres:
+        paragrafo = f"Tópico {indice + 1}\n{PARAGRAFO}"
+        paragrafos.append(paragrafo)
+        total += len(paragrafo) + 2
+        indice += 1
+    return "\n\n".join(paragrafos)[:caracteres]
+
+
+def pdf_sintetico(paginas):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate
+
+    estilos = getSampleStyleSheet()
+    story = []
+    for pagina in range(paginas):
+        story.append(Paragraph(f"Página {pagina + 1}", estilos["Heading2"]))
+        story.extend(Paragraph(PARAGRAFO, estilos["Normal"]) for _ in range(6))
+        story.append(PageBreak())
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(story)
+    return buffer.getvalue()
+
+
+def docx_sintetico(paragrafos):
+    import docx
+
+    documento = docx.Document()
+    for indice in range(paragrafos):
+        documento.add_paragraph(f"{indice + 1}. {PARAGRAFO}")
+    buffer = BytesIO()
+    documento.save(buffer)
+    return buffer.getvalue()
+
+
+def cronometrar(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+
+def bench_extracao(tamanhos_pdf, tamanhos_docx):
+    import extracao
+
+    resultados = []
+    for paginas in tamanhos_pdf:
+        dados = pdf_sintetico(paginas)
+        frio, _ = cronometrar(lambda: extracao.extrair_texto("bench.pdf", dados))
+        quente, _ = cronometrar(lambda: extracao.extrair_texto("bench.pdf", dados))
+        resultados.append({"grupo": "extracao", "caso": f"pdf_{paginas}p", "segundos": frio,
+                           "extra": {"segundos_cache": quente, "bytes": len(dados)}})
+    for paragrafos in tamanhos_docx:
+        dados = docx_sintetico(paragrafos)
+        frio, _ = cronometrar(lambda: extracao.ler_docx(BytesIO(dados)))
+        resultados.append({"grupo": "extracao", "caso": f"docx_{paragrafos}par", "segundos": frio,
+                           "extra": {"bytes": len(dados)}})
+    return resultados
+
+
+def bench_escriba(caracteres, max_combinacoes):
+    import pipeline
+
+    texto = texto_sintetico(caracteres)
+    file_hash = uuid.uuid4().hex
+    combinacoes = [
+        list(combinacao)
+        for tamanho in range(1, len(pipeline.ORDEM_SECOES) + 1)
+        for combinacao in itertools.combinations(pipeline.ORDEM_SECOES, tamanho)
+    ]
+    if max_combinacoes:
+        combinacoes = combinacoes[:max_combinacoes]
+
+    resultados = []
+    for secoes in combinacoes:
+        # Tema único por rodada para medir a geração, não o cache de módulos.
+        tema = f"bench-{uuid.uuid4().hex}"
+        segundos, _ = cronometrar(lambda: pipeline.gerar_modulo(texto, file_hash, tema, "Português", secoes))
+        resultados.append({"grupo": "escriba", "caso": pipeline.opts_tag(secoes), "segundos": segundos,
+                           "extra": {"secoes": len(secoes), "caracteres": caracteres}})
+    return resultados
+
+
+def bench_corretor(tamanhos):
+    import Corretor
+
+    resultados = []
+    for caracteres in tamanhos:
+        texto = texto_sintetico(caracteres)
+        blocos = len(Corretor.dividir_em_blocos(texto))
+        segundos, _ = cronometrar(lambda: Corretor.revisar_texto_em_blocos(texto, "Português"))
+        resultados.append({"grupo": "corretor", "caso": f"texto_{caracteres}c", "segundos": segundos,
+                           "extra": {"blocos": blocos}})
+    return resultados
+
+
+def bench_pdf(tamanhos):
+    import pdf_modulo
+
+    resultados = []
+    for caracteres in tamanhos:
+        secoes = texto_sintetico(caracteres).split("\n\n")
+        texto_final = "\n\n".join(f"Seção {i}\n{corpo}" for i, corpo in enumerate(secoes))
+        # Aquecimento: a primeira renderização paga fontes e caches do reportlab.
+        pdf_modulo.escrever_pdf_modulo(BytesIO(), "Aquecimento\ntexto", "Benchmark", "Português")
+        buffer = BytesIO()
+        segundos, _ = cronometrar(lambda: pdf_modulo.escrever_pdf_modulo(buffer, texto_final, "Benchmark", "Português"))
+        # Memória numa segunda rodada: o tracemalloc distorce o tempo.
+        tracemalloc.start()
+        pdf_modulo.escrever_pdf_modulo(BytesIO(), texto_final, "Benchmark", "Português")
+        _atual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados.append({"grupo": "pdf", "caso": f"modulo_{caracteres}c", "segundos": segundos,
+                           "extra": {"pico_memoria_bytes": pico, "bytes_pdf": len(buffer.getvalue())}})
+    return resultados
+
+
+def _tempos_importacao(saida_importtime):
+    # Linhas de "python -X importtime": (nível, módulo, segundos acumulados),
+    # na ordem em que terminaram de importar (filhos antes do pai).
+    tempos = []
+    for linha in saida_importtime.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        tempos.append((nivel, nome.strip(), int(acumulado) / 1e6))
+    return tempos
+
+
+def bench_inicializacao():
+    # Subida a frio, cada medida num processo novo: a importação dos módulos
+    # do app (o streamlit à parte) e a primeira renderização da página.
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import streamlit, Escriba, Corretor"],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    tempos = _tempos_importacao(proc.stderr)
+    inicio_app = next(i for i, (nivel, nome, _s) in enumerate(tempos) if nivel == 0 and nome == "streamlit") + 1
+    diretos = sorted(
+        ((nome, round(segundos, 4)) for nivel, nome, segundos in tempos[inicio_app:] if nivel == 1),
+        key=lambda item: -item[1],
+    )
+    carregados = {nome for _nivel, nome, _s in tempos}
+    resultados = [{
+        "grupo": "inicializacao",
+        "caso": "importar_app",
+        "segundos": sum(segundos for nivel, _nome, segundos in tempos[inicio_app:] if nivel == 0),
+        "extra": {
+            "segundos_streamlit": tempos[inicio_app - 1][2],
+            "mais_lentos": diretos[:10],
+            "bibliotecas_pesadas": sorted(carregados & {"openai", "httpx", "httpx2", "PyPDF2", "docx", "reportlab"}),
+        },
+    }]
+
+    codigo = (
+        "import time\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        "inicio = time.perf_counter()\n"
+        "AppTest.from_file('app.py', default_timeout=120).run()\n"
+        "print(time.perf_counter() - inicio)\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    resultados.append({"grupo": "inicializacao", "caso": "primeira_pagina",
+                       "segundos": float(proc.stdout.strip().splitlines()[-1]), "extra": {}})
+    return resultados
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, caminho_base, tolerancia):
+    with open(caminho_base, encoding="utf-8") as arquivo:
+        base = {(r["grupo"], r["caso"]): r["segundos"] for r in json.load(arquivo)["resultados"]}
+    regressoes = []
+    for r in atual["resultados"]:
+        anterior = base.get((r["grupo"], r["caso"]))
+        if anterior and r["segundos"] > anterior * (1 + tolerancia):
+            regressoes.append(f"{r['grupo']}/{r['caso']}: {anterior:.3f}s -> {r['segundos']:.3f}s")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline do Escriba/Corretor contra um stub local.")
+    parser.add_argument("--grupos", default="inicializacao,extracao,escriba,corretor,pdf")
+    parser.add_argument("--rapido", action="store_true", help="Tamanhos menores, para checagens rápidas.")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--tokens-por-segundo", type=float, default=2000.0)
+    parser.add_argument("--tokens-resposta", type=int, default=200)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-500", type=float, default=0.0)
+    parser.add_argument("--combinacoes", type=int, default=0, help="Limita as combinações de seções (0 = todas).")
+    parser.add_argument("--saida", help="Grava o JSON neste arquivo em vez da saída padrão.")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para apontar regressões.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Folga relativa antes de acusar regressão.")
+    args = parser.parse_args()
+
+    config = ConfigStub(latencia=args.latencia, tokens_por_segundo=args.tokens_por_segundo,
+                        tokens_resposta=args.tokens_resposta, taxa_429=args.taxa_429,
+                        taxa_500=args.taxa_500, retry_after=0.05, semente=42)
+    servidor, base_url = iniciar_stub(config)
+    pasta = tempfile.mkdtemp(prefix="escriba-bench-")
+    # Precisa vir antes de importar os módulos do app, que leem a configuração
+    # na importação.
+    os.environ.update({
+        "MARITACA_BASE_URL": base_url,
+        "MARITACA_API_KEY": "bench",
+        "MARITACA_BACKOFF_BASE": "0.05",
+        "ESCRIBA_CACHE_PATH": os.path.join(pasta, "cache.sqlite3"),
+    })
+
+    grupos = [g.strip() for g in args.grupos.split(",") if g.strip()]
+    resultados = []
+    if "inicializacao" in grupos:
+        resultados += bench_inicializacao()
+    if "extracao" in grupos:
+        resultados += bench_extracao([5, 20] if args.rapido else [10, 50, 200],
+                                     [50] if args.rapido else [100, 1000, 5000])
+    if "escriba" in grupos:
+        resultados += bench_escriba(20000 if args.rapido else 120000, 7 if args.rapido else args.combinacoes)
+    if "corretor" in grupos:
+        resultados += bench_corretor([5000, 20000] if args.rapido else [10000, 50000, 200000])
+    if "pdf" in grupos:
+        resultados += bench_pdf([10000] if args.rapido else [10000, 100000, 500000])
+    servidor.shutdown()
+
+    saida = {
+        "meta": {
+            "commit": commit_atual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "stub": {"latencia": args.latencia, "tokens_por_segundo": args.tokens_por_segundo,
+                     "tokens_resposta": args.tokens_resposta, "taxa_429": args.taxa_429,
+                     "taxa_500": args.taxa_500, **config.contadores},
+        },
+        "resultados": resultados,
+    }
+    texto = json.dumps(saida, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        regressoes = comparar(saida, args.comparar, args.tolerancia)
+        for linha in regressoes:
+            print(f"REGRESSÃO {linha}", file=sys.stderr)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local compatível com POST /chat/completions (com e sem stream),
+# para medir o overhead do app sem gastar crédito de API.
+
+
+class ConfigStub:
+
+    def __init__(self, latencia=0.2, jitter=0.0, tokens_por_segundo=200.0, tokens_resposta=300,
+                 taxa_429=0.0, taxa_500=0.0, retry_after=0.5, semente=None, taxa_lenta=0.0, latencia_lenta=0.0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_resposta = tokens_resposta
+        self.taxa_429 = taxa_429
+        self.taxa_500 = taxa_500
+        self.retry_after = retry_after
+        # Cauda: uma fração das requisições espera latencia_lenta a mais.
+        self.taxa_lenta = taxa_lenta
+        self.latencia_lenta = latencia_lenta
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.contadores = {"requisicoes": 0, "stream": 0, "erros_429": 0, "erros_500": 0,
+                           "tokens_entrada": 0, "tokens_saida": 0, "lentas": 0, "canceladas": 0}
+
+    def contar(self, **incrementos):
+        with self.lock:
+            for nome, valor in incrementos.items():
+                self.contadores[nome] += valor
+
+    def sortear(self):
+        with self.lock:
+            return (
+                self.aleatorio.random(),
+                self.aleatorio.uniform(0, self.jitter),
+                self.aleatorio.random() < self.taxa_lenta,
+            )
+
+
+def _palavras_resposta(quantidade):
+    base = "Resposta sintética do servidor local para medições de desempenho do Escriba e do Corretor".split()
+    return [base[i % len(base)] for i in range(quantidade)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        try:
+            self.wfile.write(dados)
+        except (BrokenPipeError, ConnectionResetError):
+            self.config.contar(canceladas=1)
+
+    def do_POST(self):
+        config = self.config
+        corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "rota desconhecida"}})
+            return
+
+        sorteio, jitter, lenta = config.sortear()
+        config.contar(requisicoes=1)
+        if sorteio < config.taxa_429:
+            config.contar(erros_429=1)
+            self._json(429, {"error": {"message": "rate limit (stub)"}}, {"Retry-After": str(config.retry_after)})
+            return
+        if sorteio < config.taxa_429 + config.taxa_500:
+            config.contar(erros_500=1)
+            self._json(500, {"error": {"message": "erro interno (stub)"}})
+            return
+
+        entrada = sum(len(m.get("content") or "") for m in corpo.get("messages", [])) // 4
+        max_tokens = int(corpo.get("max_tokens") or config.tokens_resposta)
+        # Numa continuação, as mensagens do assistente já trazem parte da
+        # resposta (uma palavra por token): só falta o resto.
+        escritos = sum(len((m.get("content") or "").split()) for m in corpo.get("messages", []) if m.get("role") == "assistant")
+        faltam = max(1, config.tokens_resposta - escritos)
+        saida = min(faltam, max_tokens)
+        finish_reason = "length" if faltam > max_tokens else "stop"
+        palavras = _palavras_resposta(saida)
+        uso = {"prompt_tokens": entrada, "completion_tokens": saida, "total_tokens": entrada + saida}
+        config.contar(tokens_entrada=entrada, tokens_saida=saida)
+        modelo = corpo.get("model", "stub")
+        if lenta:
+            config.contar(lentas=1)
+            jitter += config.latencia_lenta
+        time.sleep(config.latencia + jitter)
+
+        if not corpo.get("stream"):
+            time.sleep(saida / config.tokens_por_segundo)
+            self._json(200, {
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(palavras)},
+                             "finish_reason": finish_reason}],
+                "usage": uso,
+            })
+            return
+
+        config.contar(stream=1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        intervalo = 1.0 / config.tokens_por_segundo
+        self.close_connection = True
+        try:
+            for palavra in palavras:
+                time.sleep(intervalo)
+                self._evento({"choices": [{"index": 0, "delta": {"content": palavra + " "}, "finish_reason": None}]}, modelo)
+            self._evento({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": uso}, modelo)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente fechou o stream no meio (por exemplo, a perdedora de
+            # uma chamada duplicada).
+            config.contar(canceladas=1)
+
+    def _evento(self, dados, modelo):
+        dados.update({"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": modelo})
+        self.wfile.write(b"data: " + json.dumps(dados).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def iniciar_stub(config=None, porta=0):
+    # Sobe o servidor numa thread daemon e devolve (servidor, base_url).
+    handler = type("Handler", (_Handler,), {"config": config or ConfigStub()})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local compatível com chat.completions.")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos até o primeiro token.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Atraso extra aleatório (0..jitter).")
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0)
+    parser.add_argument("--tokens-resposta", type=int, default=300)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-500", type=float, default=0.0)
+    parser.add_argument("--taxa-lenta", type=float, default=0.0, help="Fração de requisições na cauda lenta.")
+    parser.add_argument("--latencia-lenta", type=float, default=0.0, help="Atraso extra das requisições lentas.")
+    args = parser.parse_args()
+    config = ConfigStub(args.latencia, args.jitter, args.tokens_por_segundo, args.tokens_resposta,
+                        args.taxa_429, args.taxa_500, taxa_lenta=args.taxa_lenta, latencia_lenta=args.latencia_lenta)
+    servidor, base_url = iniciar_stub(config, args.porta)
+    print(f"Stub em {base_url} (defina MARITACA_BASE_URL={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
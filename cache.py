@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from configuracao import obter_config
+from metricas import contar
+
+CACHE_PATH = obter_config("ESCRIBA_CACHE_PATH", os.path.join(".cache", "resultados.sqlite3"))
+CACHE_TTL = float(obter_config("ESCRIBA_CACHE_TTL", 30 * 24 * 3600))
+CACHE_MAX_BYTES_DISCO = int(obter_config("ESCRIBA_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+CACHE_MAX_ITENS_MEMORIA = int(obter_config("ESCRIBA_CACHE_MAX_ITENS_MEMORIA", 256))
+# De quanto em quanto tempo (s) as gravações apagam os itens expirados e
+# reconferem o total em disco, que outros processos também alteram.
+CACHE_INTERVALO_LIMPEZA = float(obter_config("ESCRIBA_CACHE_INTERVALO_LIMPEZA", 300))
+
+
+def chave_cache(*partes):
+    return "__".join(str(p) for p in partes)
+
+
+def _registrar_consulta(chave, resultado):
+    # O namespace é o prefixo da chave ("escriba", "extracao", "digest"...).
+    contar("cache", chave.split("__", 1)[0], "cache_" + resultado)
+
+
+class CacheCompartilhado:
+    # Cache de resultados em dois níveis: LRU em memória na frente de um
+    # SQLite em disco. É compartilhado por todas as sessões do processo e,
+    # via SQLite (WAL), entre processos e reinícios.
+
+    def __init__(self, caminho=CACHE_PATH, ttl=CACHE_TTL, max_bytes_disco=CACHE_MAX_BYTES_DISCO,
+                 max_itens_memoria=CACHE_MAX_ITENS_MEMORIA):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.max_bytes_disco = max_bytes_disco
+        self.max_itens_memoria = max_itens_memoria
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {"hits_memoria": 0, "hits_disco": 0, "misses": 0, "gravacoes": 0, "despejos": 0}
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resultados ("
+            " chave TEXT PRIMARY KEY,"
+            " valor TEXT NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado REAL NOT NULL,"
+            " expira REAL NOT NULL,"
+            " acesso REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (acesso)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_expira ON resultados (expira)")
+        self._conn.commit()
+        # Total em bytes mantido a cada gravação e remoção, para não somar a
+        # tabela inteira sob o lock a cada gravar.
+        self._bytes_disco = self._somar_disco()
+        self._proxima_limpeza = time.time() + CACHE_INTERVALO_LIMPEZA
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                valor, expira = item
+                if expira > agora:
+                    self._memoria.move_to_end(chave)
+                    self._contadores["hits_memoria"] += 1
+                    _registrar_consulta(chave, "hit_memoria")
+                    return valor
+                del self._memoria[chave]
+
+            linha = self._conn.execute(
+                "SELECT valor, expira, tamanho FROM resultados WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or linha[1] <= agora:
+                if linha is not None:
+                    self._conn.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+                    self._conn.commit()
+                    self._bytes_disco -= linha[2]
+                self._contadores["misses"] += 1
+                _registrar_consulta(chave, "miss")
+                return None
+
+            self._conn.execute("UPDATE resultados SET acesso = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+            valor = json.loads(linha[0])
+            self._lembrar(chave, valor, linha[1])
+            self._contadores["hits_disco"] += 1
+            _registrar_consulta(chave, "hit_disco")
+            return valor
+
+    def gravar(self, chave, valor, ttl=None):
+        agora = time.time()
+        expira = agora + (self.ttl if ttl is None else ttl)
+        serializado = json.dumps(valor, ensure_ascii=False)
+        tamanho = len(serializado.encode("utf-8"))
+        with self._lock:
+            anterior = self._tamanho(chave)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resultados (chave, valor, tamanho, criado, expira, acesso)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, serializado, tamanho, agora, expira, agora),
+            )
+            self._bytes_disco += tamanho - anterior
+            if agora >= self._proxima_limpeza:
+                self._limpar_expirados(agora)
+            if self._bytes_disco > self.max_bytes_disco:
+                self._despejar_disco()
+            self._conn.commit()
+            self._lembrar(chave, valor, expira)
+            self._contadores["gravacoes"] += 1
+
+    def remover(self, chave):
+        with self._lock:
+            self._memoria.pop(chave, None)
+            self._bytes_disco -= self._tamanho(chave)
+            self._conn.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+            self._conn.commit()
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            itens_disco, bytes_disco = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados"
+            ).fetchone()
+            dados["itens_memoria"] = len(self._memoria)
+        dados["itens_disco"] = itens_disco
+        dados["bytes_disco"] = bytes_disco
+        consultas = dados["hits_memoria"] + dados["hits_disco"] + dados["misses"]
+        dados["taxa_acerto"] = (dados["hits_memoria"] + dados["hits_disco"]) / consultas if consultas else 0.0
+        return dados
+
+    def _lembrar(self, chave, valor, expira):
+        self._memoria[chave] = (valor, expira)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_itens_memoria:
+            self._memoria.popitem(last=False)
+
+    def _somar_disco(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()
+        return total
+
+    def _tamanho(self, chave):
+        linha = self._conn.execute("SELECT tamanho FROM resultados WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else 0
+
+    def _limpar_expirados(self, agora):
+        self._conn.execute("DELETE FROM resultados WHERE expira <= ?", (agora,))
+        self._bytes_disco = self._somar_disco()
+        self._proxima_limpeza = agora + CACHE_INTERVALO_LIMPEZA
+
+    def _despejar_disco(self):
+        # Só roda quando o total passa do limite.
+        excesso = self._bytes_disco - self.max_bytes_disco
+        removidas = []
+        for chave, tamanho in self._conn.execute("SELECT chave, tamanho FROM resultados ORDER BY acesso"):
+            removidas.append((chave,))
+            excesso -= tamanho
+            self._bytes_disco -= tamanho
+            if excesso <= 0:
+                break
+        self._conn.executemany("DELETE FROM resultados WHERE chave = ?", removidas)
+        for (chave,) in removidas:
+            self._memoria.pop(chave, None)
+        self._contadores["despejos"] += len(removidas)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheCompartilhado()
+        return _cache
@@ -0,0 +1,14 @@
+import os
+
+
+def obter_config(nome, padrao=None):
+    # Variáveis de ambiente têm prioridade (modo lote, benchmarks, containers);
+    # na interface, cai para .streamlit/secrets.toml.
+    valor = os.environ.get(nome)
+    if valor is not None:
+        return valor
+    try:
+        import streamlit as st
+        return st.secrets.get(nome, padrao)
+    except Exception:
+        return padrao
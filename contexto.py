@@ -0,0 +1,156 @@
+import re
+from collections import Counter
+
+from cache import chave_cache, obter_cache
+from tokens import CARACTERES_POR_TOKEN, estimar_tokens
+
+VERSAO_DIGEST = 1
+
+# Orçamento de contexto (tokens estimados) que cada seção recebe do material
+# de base. Se o texto inteiro couber, ele vai completo.
+ORCAMENTO_SECAO = {
+    "resumo": 6000,
+    "introducao": 2500,
+    "unidades": 8000,
+    "glossario": 2500,
+    "links": 1500,
+    "conclusao": 2000,
+    "referencias": 2000,
+}
+ORCAMENTO_PADRAO = 3000
+
+MAX_TOPICOS = 40
+MAX_TERMOS = 60
+MAX_TRECHOS = 80
+
+STOPWORDS = set("""
+a à ao aos as às até com como da das de dei do dos e é ela elas ele eles em entre era essa esse esta este eu foi
+for há isso isto já la lhe mais mas me mesmo muito na nas não nem no nos nós o os ou para pela pelas pelo pelos
+por qual quando que quem se sem ser seu seus sua suas são também te tem têm um uma umas uns você vocês
+the of and to in is for on that with as by this are be or from at an it its was were which their have has
+""".split())
+
+_RE_URL = re.compile(r"(https?://\S+|www\.\S+|doi:\s*\S+|10\.\d{4,9}/\S+)", re.IGNORECASE)
+_RE_ANEXO = re.compile(r"\b(anexo|apêndice|appendix|annex)\b", re.IGNORECASE)
+_RE_REFERENCIA = re.compile(r"^[A-ZÀ-Ý][A-ZÀ-Ý'\-]+,\s+.+\b(1[89]\d\d|20\d\d)\b")
+_RE_FRASE = re.compile(r"(?<=[.!?…])\s+")
+_RE_PALAVRA = re.compile(r"[A-Za-zÀ-ÿ][A-Za-zÀ-ÿ\-]{3,}")
+
+
+def _parece_titulo(linha):
+    if not 3 <= len(linha) <= 90 or linha.endswith((".", ",", ";", ":")):
+        return False
+    if re.match(r"^(\d+(\.\d+)*[.)]?|[IVXLC]+[.)]|cap[ií]tulo|unidade|se[cç][aã]o|m[oó]dulo)\s", linha, re.IGNORECASE):
+        return True
+    palavras = linha.split()
+    return len(palavras) <= 10 and (linha.isupper() or sum(p[:1].isupper() for p in palavras) >= len(palavras) * 0.6)
+
+
+def _palavras(texto):
+    return [p.lower() for p in _RE_PALAVRA.findall(texto)]
+
+
+def construir_digest(texto):
+    linhas = [l.strip() for l in texto.splitlines() if l.strip()]
+    topicos = []
+    for linha in linhas:
+        if _parece_titulo(linha) and linha not in topicos:
+            topicos.append(linha)
+            if len(topicos) >= MAX_TOPICOS:
+                break
+
+    frequencias = Counter(p for p in _palavras(texto) if p not in STOPWORDS)
+    # Termos: palavras longas e recorrentes, mas não onipresentes.
+    termos = [
+        palavra for palavra, freq in frequencias.most_common()
+        if len(palavra) >= 7 and 2 <= freq
+    ][:MAX_TERMOS]
+
+    frases = list(dict.fromkeys(
+        f.strip() for f in _RE_FRASE.split(re.sub(r"\s+", " ", texto)) if len(f.strip()) > 40
+    ))
+    pontuadas = []
+    for indice, frase in enumerate(frases):
+        palavras = [p for p in _palavras(frase) if p not in STOPWORDS]
+        if not palavras:
+            continue
+        pontuacao = sum(frequencias[p] for p in palavras) / len(palavras) ** 0.5
+        pontuadas.append((pontuacao, indice, frase))
+    escolhidas = sorted(sorted(pontuadas, reverse=True)[:MAX_TRECHOS], key=lambda item: item[1])
+
+    return {
+        "versao": VERSAO_DIGEST,
+        "topicos": topicos,
+        "termos": termos,
+        "trechos": [frase for _pontuacao, _indice, frase in escolhidas],
+        "links": [l for l in linhas if _RE_URL.search(l) or _RE_ANEXO.search(l)],
+        "referencias": [l for l in linhas if _RE_REFERENCIA.match(l)],
+    }
+
+
+def obter_digest(file_hash, texto):
+    cache = obter_cache()
+    cache_key = chave_cache("digest", file_hash, VERSAO_DIGEST)
+    digest = cache.obter(cache_key)
+    if digest is None:
+        digest = construir_digest(texto)
+        cache.gravar(cache_key, digest)
+    return digest
+
+
+def _limitar(partes, orcamento_tokens):
+    saida = []
+    restante = orcamento_tokens * CARACTERES_POR_TOKEN
+    for parte in partes:
+        if len(parte) + 1 > restante:
+            break
+        saida.append(parte)
+        restante -= len(parte) + 1
+    return saida
+
+
+def _bloco(titulo, itens, orcamento_tokens):
+    itens = _limitar(itens, orcamento_tokens)
+    if not itens:
+        return ""
+    return titulo + ":\n" + "\n".join(itens)
+
+
+def contexto_para_secao(secao_id, texto, digest, orcamento_tokens=None):
+    # Devolve o material de base que a seção precisa, dentro do orçamento.
+    if orcamento_tokens is None:
+        orcamento_tokens = ORCAMENTO_SECAO.get(secao_id, ORCAMENTO_PADRAO)
+    if not texto:
+        return ""
+    if estimar_tokens(texto) <= orcamento_tokens:
+        return texto
+
+    topicos = digest["topicos"]
+    trechos = digest["trechos"]
+    if secao_id == "links":
+        blocos = [_bloco("Linhas com links e anexos", digest["links"], orcamento_tokens)]
+    elif secao_id == "referencias":
+        metade = orcamento_tokens // 2
+        blocos = [
+            _bloco("Referências encontradas", digest["referencias"], metade),
+            _bloco("Linhas com links e anexos", digest["links"], orcamento_tokens - metade),
+        ]
+    elif secao_id == "glossario":
+        termos = digest["termos"]
+        com_termos = [f for f in trechos if any(t in f.lower() for t in termos)]
+        blocos = [
+            _bloco("Termos candidatos", termos, orcamento_tokens // 4),
+            _bloco("Trechos onde aparecem", com_termos, orcamento_tokens - orcamento_tokens // 4),
+        ]
+    else:
+        parte_topicos = orcamento_tokens // 5
+        blocos = [
+            _bloco("Estrutura do material", topicos, parte_topicos),
+            _bloco("Trechos principais", trechos, orcamento_tokens - parte_topicos),
+        ]
+    contexto = "\n\n".join(b for b in blocos if b)
+    # Sem nenhuma linha do tipo procurado, vai o início do material: um
+    # pedido sem conteúdo convida o modelo a inventar referências.
+    if not contexto:
+        contexto = texto[:orcamento_tokens * CARACTERES_POR_TOKEN]
+    return contexto
@@ -0,0 +1,128 @@
+import hashlib
+import heapq
+import random
+import re
+import threading
+import time
+import unicodedata
+
+from cache import chave_cache, obter_cache
+from configuracao import obter_config
+from metricas import registrar
+
+# Identifica uploads que são o mesmo material com bytes diferentes (PDF
+# reexportado, espaços, metadados) para que reaproveitem digest e seções.
+VERSAO_IMPRESSAO = 2
+LIMIAR_SIMILARIDADE = float(obter_config("ESCRIBA_LIMIAR_SIMILARIDADE", 0.9))
+TAMANHO_SHINGLE = 5
+NUM_PERMUTACOES = 64
+# As permutações rodam só sobre os MAX_SHINGLES menores hashes de shingle
+# (amostra determinística: textos quase iguais guardam quase os mesmos),
+# para o custo não crescer com o tamanho do material.
+MAX_SHINGLES = int(obter_config("ESCRIBA_MAX_SHINGLES", 2048))
+# 16 bandas de 4 linhas: pares com similaridade acima de ~0,5 costumam cair
+# juntos em alguma banda; o limiar de verdade é conferido na assinatura.
+NUM_BANDAS = 16
+MAX_POR_BALDE = 32
+
+_PRIMO = (1 << 61) - 1
+_sorteio = random.Random(VERSAO_IMPRESSAO)
+_COEFICIENTES = [(_sorteio.randrange(1, _PRIMO), _sorteio.randrange(0, _PRIMO)) for _ in range(NUM_PERMUTACOES)]
+
+_indice_lock = threading.Lock()
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize("NFKC", texto)
+    # Junta palavras hifenizadas na quebra de linha ("educa-\nção").
+    texto = re.sub(r"(\w)-\s*\n\s*(\w)", r"\1\2", texto)
+    return re.sub(r"\s+", " ", texto).strip().lower()
+
+
+def hash_normalizado(texto_normalizado):
+    return hashlib.sha256(texto_normalizado.encode("utf-8")).hexdigest()
+
+
+def _hashes_shingles(texto_normalizado):
+    palavras = texto_normalizado.split()
+    if len(palavras) <= TAMANHO_SHINGLE:
+        shingles = {" ".join(palavras)}
+    else:
+        shingles = {" ".join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+    return [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+
+
+def assinatura_minhash(texto_normalizado):
+    hashes = heapq.nsmallest(MAX_SHINGLES, _hashes_shingles(texto_normalizado))
+    return [min((a * h + b) % _PRIMO for h in hashes) for a, b in _COEFICIENTES]
+
+
+def similaridade(assinatura_a, assinatura_b):
+    # Estimativa da similaridade de Jaccard entre os conjuntos de shingles.
+    return sum(x == y for x, y in zip(assinatura_a, assinatura_b)) / NUM_PERMUTACOES
+
+
+def _baldes(assinatura):
+    linhas = NUM_PERMUTACOES // NUM_BANDAS
+    for banda in range(NUM_BANDAS):
+        valores = ",".join(str(v) for v in assinatura[banda * linhas:(banda + 1) * linhas])
+        yield chave_cache("lsh", VERSAO_IMPRESSAO, banda, hashlib.sha1(valores.encode()).hexdigest())
+
+
+def _buscar_similar(cache, assinatura):
+    candidatos = set()
+    for chave_balde in _baldes(assinatura):
+        candidatos.update(cache.obter(chave_balde) or [])
+    melhor, melhor_similaridade = None, 0.0
+    for candidato in candidatos:
+        outra = cache.obter(chave_cache("assinatura", VERSAO_IMPRESSAO, candidato))
+        if outra is None:
+            continue
+        valor = similaridade(assinatura, outra)
+        if valor > melhor_similaridade:
+            melhor, melhor_similaridade = candidato, valor
+    return melhor, melhor_similaridade
+
+
+def _indexar(cache, conteudo_hash, assinatura):
+    cache.gravar(chave_cache("assinatura", VERSAO_IMPRESSAO, conteudo_hash), assinatura)
+    for chave_balde in _baldes(assinatura):
+        membros = cache.obter(chave_balde) or []
+        if conteudo_hash not in membros:
+            cache.gravar(chave_balde, (membros + [conteudo_hash])[-MAX_POR_BALDE:])
+
+
+def identificar_conteudo(file_hash, texto, limiar=LIMIAR_SIMILARIDADE):
+    # Devolve {"hash", "tipo", "similaridade"}: o hash de conteúdo a usar nas
+    # chaves de digest e seções, e como foi encontrado ("novo", "normalizado"
+    # para o mesmo texto normalizado, "similar" acima do limiar MinHash).
+    cache = obter_cache()
+    chave_arquivo = chave_cache("conteudo", VERSAO_IMPRESSAO, file_hash)
+    identificacao = cache.obter(chave_arquivo)
+    if identificacao is not None:
+        registrar("duplicata", 0.0, cache="exato")
+        return identificacao
+
+    inicio = time.perf_counter()
+    normalizado = normalizar_texto(texto)
+    chave_normalizado = chave_cache("normalizado", VERSAO_IMPRESSAO, hash_normalizado(normalizado))
+    # A assinatura é calculada fora do lock, que só protege a leitura e a
+    # escrita do índice.
+    assinatura = assinatura_minhash(normalizado) if cache.obter(chave_normalizado) is None else None
+    with _indice_lock:
+        canonico = cache.obter(chave_normalizado)
+        if canonico is not None:
+            identificacao = {"hash": canonico, "tipo": "normalizado", "similaridade": 1.0}
+        else:
+            if assinatura is None:
+                assinatura = assinatura_minhash(normalizado)
+            similar, valor = _buscar_similar(cache, assinatura) if normalizado else (None, 0.0)
+            if similar is not None and valor >= limiar:
+                identificacao = {"hash": similar, "tipo": "similar", "similaridade": valor}
+            else:
+                identificacao = {"hash": file_hash, "tipo": "novo", "similaridade": None}
+                _indexar(cache, file_hash, assinatura)
+            cache.gravar(chave_normalizado, identificacao["hash"])
+    cache.gravar(chave_arquivo, identificacao)
+    registrar("duplicata", time.perf_counter() - inicio, cache=identificacao["tipo"])
+    return identificacao
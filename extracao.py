@@ -0,0 +1,280 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from cache import chave_cache, obter_cache
+from configuracao import obter_config
+from duplicatas import identificar_conteudo
+from metricas import medir
+
+# PyPDF2 e python-docx são importados só na primeira extração, fora da
+# subida do app.
+
+# Abaixo deste número de páginas o custo de enviar o arquivo aos processos
+# supera o ganho; extrai direto no processo atual.
+MIN_PAGINAS_PARALELO = int(obter_config("ESCRIBA_MIN_PAGINAS_PARALELO", 16))
+MAX_PROCESSOS_EXTRACAO = int(obter_config("ESCRIBA_MAX_PROCESSOS_EXTRACAO", min(4, os.cpu_count() or 1)))
+TAMANHO_BLOCO_LEITURA = 1024 * 1024
+
+# hash: sha256 dos bytes (cache da extração). hash_conteudo: identidade do
+# material para digest e seções; coincide com hash, exceto quando o texto é
+# duplicata de um upload anterior (ver duplicatas.identificar_conteudo). Só
+# as extrações com identificar=True (geração de módulos) procuram
+# duplicatas; nas demais, duplicata é None.
+Extracao = namedtuple("Extracao", ["texto", "hash", "tempos_paginas", "do_cache", "hash_conteudo", "duplicata"])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_PROCESSOS_EXTRACAO,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _abrir(origem):
+    # origem: os bytes do arquivo ou o caminho dele em disco. Com um caminho,
+    # os processos da extração abrem o arquivo em vez de receber uma cópia.
+    return BytesIO(origem) if isinstance(origem, bytes) else origem
+
+
+def _links_pagina(pagina):
+    # URIs das anotações de link da página: costumam ser links que o texto
+    # extraído não mostra (o texto visível é "clique aqui", por exemplo).
+    import PyPDF2
+
+    links = []
+    try:
+        for anotacao in pagina.get("/Annots") or []:
+            anotacao = anotacao.get_object()
+            acao = anotacao.get("/A")
+            if anotacao.get("/Subtype") != "/Link" or acao is None:
+                continue
+            uri = acao.get_object().get("/URI")
+            if uri:
+                links.append(str(uri))
+    except (PyPDF2.errors.PyPdfError, AttributeError, KeyError, TypeError):
+        pass
+    return links
+
+
+def _extrair_paginas(origem, inicio, fim):
+    import PyPDF2
+
+    leitor = PyPDF2.PdfReader(_abrir(origem))
+    paginas = []
+    for indice in range(inicio, fim):
+        t0 = time.perf_counter()
+        pagina = leitor.pages[indice]
+        texto_pagina = pagina.extract_text() or ""
+        paginas.append((texto_pagina, time.perf_counter() - t0, _links_pagina(pagina)))
+    return paginas
+
+
+def _extrair_pdf(origem):
+    import PyPDF2
+
+    total_paginas = len(PyPDF2.PdfReader(_abrir(origem)).pages)
+    if total_paginas < MIN_PAGINAS_PARALELO or MAX_PROCESSOS_EXTRACAO <= 1:
+        return _extrair_paginas(origem, 0, total_paginas)
+
+    tamanho_faixa = -(-total_paginas // MAX_PROCESSOS_EXTRACAO)
+    faixas = [(i, min(i + tamanho_faixa, total_paginas)) for i in range(0, total_paginas, tamanho_faixa)]
+    try:
+        pool = _obter_pool()
+        futuros = [pool.submit(_extrair_paginas, origem, inicio, fim) for inicio, fim in faixas]
+        paginas = []
+        for futuro in futuros:
+            paginas.extend(futuro.result())
+        return paginas
+    except BrokenProcessPool:
+        _descartar_pool()
+        return _extrair_paginas(origem, 0, total_paginas)
+
+
+def ler_txt(arquivo):
+    arquivo.seek(0)
+    return arquivo.read().decode("utf-8").strip()
+
+
+def _texto_docx(doc):
+    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+
+
+def ler_docx(arquivo):
+    import docx
+
+    arquivo.seek(0)
+    return _texto_docx(docx.Document(arquivo))
+
+
+def _links_docx(doc):
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+
+    return [rel.target_ref for rel in doc.part.rels.values() if rel.reltype == RT.HYPERLINK and rel.is_external]
+
+
+def extensao_suportada(nome_arquivo):
+    return nome_arquivo.split(".")[-1].lower() in ("pdf", "txt", "docx")
+
+
+def _extensao(nome_arquivo):
+    ext = nome_arquivo.split(".")[-1].lower()
+    if not extensao_suportada(nome_arquivo):
+        raise ValueError(f"Formato de arquivo não suportado: .{ext}")
+    return ext
+
+
+def _ler(ext, origem):
+    # Devolve (texto, tempos_paginas, links): links são os das anotações do
+    # PDF ou dos hiperlinks do DOCX.
+    if ext == "pdf":
+        paginas = _extrair_pdf(origem)
+        texto = "\n".join(texto_pagina for texto_pagina, _segundos, _links in paginas if texto_pagina).strip()
+        links = [link for _texto, _segundos, links_pagina in paginas for link in links_pagina]
+        return texto, [segundos for _texto, segundos, _links in paginas], links
+    if isinstance(origem, bytes):
+        arquivo = BytesIO(origem)
+    else:
+        arquivo = open(origem, "rb")
+    with arquivo:
+        if ext == "txt":
+            return ler_txt(arquivo), [], []
+        import docx
+
+        doc = docx.Document(arquivo)
+        return _texto_docx(doc), [], _links_docx(doc)
+
+
+def _identificar(file_hash, texto, identificar):
+    duplicata = identificar_conteudo(file_hash, texto) if identificar else None
+    return (duplicata["hash"] if duplicata else file_hash), duplicata
+
+
+def _extrair(ext, file_hash, tamanho, ler, identificar):
+    # Reaproveita o cache compartilhado pelo sha256 do arquivo; ler() só é
+    # chamado quando não há texto em cache.
+    with medir("extracao", formato=ext, bytes=tamanho) as medicao:
+        cache = obter_cache()
+        cache_key = chave_cache("extracao", file_hash)
+        texto = cache.obter(cache_key)
+        if texto is not None:
+            medicao["cache"] = "hit"
+            return Extracao(texto, file_hash, [], True, *_identificar(file_hash, texto, identificar))
+
+        medicao["cache"] = "miss"
+        texto, tempos_paginas, links = ler()
+        if tempos_paginas:
+            medicao["paginas"] = len(tempos_paginas)
+        cache.gravar(cache_key, texto)
+        if links:
+            cache.gravar(chave_cache("links_arquivo", file_hash), list(dict.fromkeys(links)))
+        return Extracao(texto, file_hash, tempos_paginas, False, *_identificar(file_hash, texto, identificar))
+
+
+def links_do_arquivo(file_hash):
+    # Links que estavam só nas anotações/hiperlinks do arquivo, gravados na
+    # extração. Vazio para extrações feitas antes de existir este registro.
+    return obter_cache().obter(chave_cache("links_arquivo", file_hash)) or []
+
+
+def extrair_texto(nome_arquivo, file_bytes, identificar=False):
+    # Extrai o texto de bytes em memória. Levanta ValueError para formatos
+    # não suportados.
+    ext = _extensao(nome_arquivo)
+    file_hash = hashlib.sha256(file_bytes).hexdigest()
+    return _extrair(ext, file_hash, len(file_bytes), lambda: _ler(ext, file_bytes), identificar)
+
+
+def _hash_arquivo(arquivo, destino=None):
+    # sha256 e tamanho de um arquivo aberto, lido em blocos; com destino, os
+    # blocos também são copiados para ele na mesma passada.
+    arquivo.seek(0)
+    sha = hashlib.sha256()
+    tamanho = 0
+    for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_LEITURA), b""):
+        sha.update(bloco)
+        tamanho += len(bloco)
+        if destino is not None:
+            destino.write(bloco)
+    return sha.hexdigest(), tamanho
+
+
+def extrair_texto_upload(nome_arquivo, arquivo, identificar=False):
+    # Como extrair_texto, para um arquivo aberto (upload do Streamlit). O hash
+    # é calculado em blocos e, só sem cache, o conteúdo é copiado para um
+    # temporário em disco, de onde leitores e processos de extração leem.
+    ext = _extensao(nome_arquivo)
+    file_hash, tamanho = _hash_arquivo(arquivo)
+
+    def ler():
+        caminho, _hash, _tamanho = salvar_upload(nome_arquivo, arquivo)
+        try:
+            return _ler(ext, caminho)
+        finally:
+            os.remove(caminho)
+
+    return _extrair(ext, file_hash, tamanho, ler, identificar)
+
+
+def salvar_upload(nome_arquivo, arquivo):
+    # Copia um upload para um temporário em disco, para ser extraído depois
+    # (ou em outra thread) sem compartilhar o objeto do Streamlit. Devolve
+    # (caminho, hash, tamanho); quem chama remove o arquivo.
+    ext = _extensao(nome_arquivo)
+    with tempfile.NamedTemporaryFile(prefix="escriba-upload-", suffix="." + ext, delete=False) as temporario:
+        file_hash, tamanho = _hash_arquivo(arquivo, temporario)
+    return temporario.name, file_hash, tamanho
+
+
+def extrair_texto_salvo(nome_arquivo, caminho, file_hash, tamanho, identificar=False):
+    # Extrai de um arquivo gravado por salvar_upload, sem recalcular o hash.
+    ext = _extensao(nome_arquivo)
+    return _extrair(ext, file_hash, tamanho, lambda: _ler(ext, caminho), identificar)
+
+
+def _resumo_duplicata(extracao):
+    duplicata = extracao.duplicata or {}
+    if duplicata.get("tipo") == "normalizado":
+        return " Mesmo texto de um arquivo já processado; resultados reaproveitados."
+    if duplicata.get("tipo") == "similar":
+        return (
+            f" Conteúdo {duplicata['similaridade']:.0%} semelhante a um arquivo já processado; "
+            "resultados reaproveitados."
+        )
+    return ""
+
+
+def resumo_extracao(extracao):
+    if extracao.do_cache:
+        return "Texto extraído reaproveitado do cache." + _resumo_duplicata(extracao)
+    if not extracao.tempos_paginas:
+        return "Texto extraído." + _resumo_duplicata(extracao)
+    total = sum(extracao.tempos_paginas)
+    mais_lenta = max(range(len(extracao.tempos_paginas)), key=extracao.tempos_paginas.__getitem__)
+    return (
+        f"Extração: {len(extracao.tempos_paginas)} páginas, {total:.2f}s de CPU somadas "
+        f"(mais lenta: página {mais_lenta + 1}, {extracao.tempos_paginas[mais_lenta]:.2f}s)."
+        + _resumo_duplicata(extracao)
+    )
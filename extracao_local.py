@@ -0,0 +1,161 @@
+import math
+import re
+from collections import Counter
+
+from configuracao import obter_config
+from contexto import STOPWORDS
+
+# Etapas determinísticas sobre o material de base, que rodam antes da API:
+# links, DOIs e anexos citados, e termos candidatos ao glossário.
+MAX_CANDIDATOS_GLOSSARIO = int(obter_config("ESCRIBA_MAX_CANDIDATOS_GLOSSARIO", 25))
+# Com menos candidatos que isto, o glossário volta a ler o material todo.
+MIN_CANDIDATOS_GLOSSARIO = int(obter_config("ESCRIBA_MIN_CANDIDATOS_GLOSSARIO", 5))
+# Frases por trecho no índice de raridade dos termos.
+FRASES_POR_TRECHO = 5
+MAX_CARACTERES_EXEMPLO = 200
+LIGACAO_MINIMA = 0.5
+
+_RE_URL = re.compile(r"(?:https?://|www\.)[^\s<>\"'«»]+", re.IGNORECASE)
+_RE_DOI = re.compile(r"\b(?:doi:\s*)?(10\.\d{4,9}/[^\s<>\"'«»]+)", re.IGNORECASE)
+_RE_DOI_URL = re.compile(r"^https?://(?:dx\.)?doi\.org/(10\.\d{4,9}/.+)$", re.IGNORECASE)
+_RE_ANEXO = re.compile(
+    r"\b((?i:anexo|apêndice|apendice|appendix|annex))\s+([A-Z]{1,2}|[IVXLC]+|\d{1,3})\b"
+    r"(?:\s*[-–—:]\s*([^\n.;]{3,80}))?"
+)
+_RE_FRASE = re.compile(r"(?<=[.!?…])\s+|\n\s*\n")
+_RE_PALAVRA = re.compile(r"[A-Za-zÀ-ÿ][A-Za-zÀ-ÿ\-]*[A-Za-zÀ-ÿ]")
+
+ROTULOS_LINKS = {
+    "Português": ("Links citados", "DOIs", "Anexos"),
+    "Inglês": ("Cited links", "DOIs", "Annexes"),
+}
+
+
+def _limpar_url(url):
+    # Tira a pontuação que encerra a frase e parênteses sem par.
+    url = url.rstrip(".,;:!?")
+    while url.endswith(")") and url.count("(") < url.count(")"):
+        url = url[:-1].rstrip(".,;:!?")
+    return url
+
+
+def extrair_links(texto, anotacoes=()):
+    # Devolve {"links", "dois", "anexos"} na ordem em que aparecem, sem
+    # repetições. anotacoes são links que vieram do arquivo e não do texto
+    # (ver extracao.links_do_arquivo).
+    links, dois, anexos = {}, {}, {}
+
+    for url in [m.group(0) for m in _RE_URL.finditer(texto)] + list(anotacoes):
+        url = _limpar_url(url)
+        doi = _RE_DOI_URL.match(url)
+        if doi:
+            dois.setdefault(doi.group(1).lower(), doi.group(1))
+        elif "." in url.split("//", 1)[-1]:
+            links.setdefault(url.rstrip("/").lower(), url)
+
+    for match in _RE_DOI.finditer(texto):
+        doi = _limpar_url(match.group(1))
+        dois.setdefault(doi.lower(), doi)
+
+    for match in _RE_ANEXO.finditer(texto):
+        tipo, identificador, titulo = match.groups()
+        nome = f"{tipo.capitalize()} {identificador}"
+        chave = nome.lower()
+        if titulo and anexos.get(chave, nome) == nome:
+            anexos[chave] = f"{nome} — {titulo.strip()}"
+        else:
+            anexos.setdefault(chave, nome)
+
+    return {
+        "links": list(links.values()),
+        "dois": [f"https://doi.org/{doi}" for doi in dois.values()],
+        "anexos": list(anexos.values()),
+    }
+
+
+def formatar_links(encontrados, idioma):
+    rotulos = ROTULOS_LINKS.get(idioma, ROTULOS_LINKS["Português"])
+    blocos = []
+    for chave, rotulo in zip(("links", "dois", "anexos"), rotulos):
+        if encontrados[chave]:
+            blocos.append(rotulo + ":\n" + "\n".join(f"{n}. {item}" for n, item in enumerate(encontrados[chave], 1)))
+    return "\n\n".join(blocos)
+
+
+def _frases(texto):
+    # Sem repetições: cabeçalhos e rodapés de página não inflam a contagem.
+    return list(dict.fromkeys(re.sub(r"\s+", " ", f).strip() for f in _RE_FRASE.split(texto) if f.strip()))
+
+
+def candidatos_glossario(texto, max_termos=MAX_CANDIDATOS_GLOSSARIO):
+    # Devolve [(termo, primeira frase em que aparece)], do mais ao menos
+    # relevante. A pontuação é frequência × raridade (idf entre trechos do
+    # próprio material: um termo repetido num só capítulo pesa mais que um
+    # espalhado pelo texto todo), favorecendo palavras longas, siglas e
+    # expressões de duas palavras que se repetem.
+    frases = _frases(texto)
+    if not frases:
+        return []
+
+    frequencias = Counter()
+    trechos_com = Counter()
+    primeira = {}
+    forma = {}
+    for inicio in range(0, len(frases), FRASES_POR_TRECHO):
+        vistos = set()
+        for indice in range(inicio, min(inicio + FRASES_POR_TRECHO, len(frases))):
+            palavras = _RE_PALAVRA.findall(frases[indice])
+            termos = []
+            for posicao, palavra in enumerate(palavras):
+                chave = palavra.lower()
+                if chave in STOPWORDS:
+                    continue
+                sigla = palavra.isupper() and 2 <= len(palavra) <= 6
+                if sigla or len(chave) >= 6:
+                    termos.append((chave, palavra))
+                if posicao + 1 < len(palavras):
+                    proxima = palavras[posicao + 1]
+                    if len(chave) >= 4 and len(proxima) >= 4 and proxima.lower() not in STOPWORDS:
+                        termos.append((chave + " " + proxima.lower(), palavra + " " + proxima))
+            for chave, original in termos:
+                frequencias[chave] += 1
+                vistos.add(chave)
+                primeira.setdefault(chave, indice)
+                forma.setdefault(chave, original)
+        trechos_com.update(vistos)
+
+    total_trechos = -(-len(frases) // FRASES_POR_TRECHO)
+    pontuados = []
+    for chave, freq in frequencias.items():
+        composto = " " in chave
+        sigla = forma[chave].isupper() and not composto
+        if freq < 2 and not sigla:
+            continue
+        # Expressões só contam quando as palavras andam juntas na maior parte
+        # das vezes, e não por coincidência de vizinhança.
+        if composto and freq < LIGACAO_MINIMA * min(frequencias[p] or freq for p in chave.split()):
+            continue
+        raridade = math.log(1 + total_trechos / trechos_com[chave])
+        peso = 1.5 if composto else (2.0 if sigla else min(len(chave), 14) / 8)
+        pontuados.append((freq * raridade * peso, chave))
+    pontuados.sort(reverse=True)
+
+    escolhidos = []
+    for _pontuacao, chave in pontuados:
+        # Uma palavra que quase só aparece dentro de uma expressão escolhida
+        # não entra sozinha (e vice-versa).
+        if any(
+            (chave in outro.split() or outro in chave.split()) and frequencias[chave] <= 2 * frequencias[outro]
+            for outro in escolhidos
+        ):
+            continue
+        escolhidos.append(chave)
+        if len(escolhidos) >= max_termos:
+            break
+    return [(forma[chave], frases[primeira[chave]][:MAX_CARACTERES_EXEMPLO]) for chave in escolhidos]
+
+
+def contexto_glossario(candidatos):
+    return "Termos candidatos, com a primeira frase em que aparecem no material:\n" + "\n".join(
+        f"{n}. {termo} — \"{frase}\"" for n, (termo, frase) in enumerate(candidatos, 1)
+    )
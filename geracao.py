@@ -0,0 +1,117 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MAX_CONCORRENCIA_PADRAO = 4
+
+
+def executar_concorrente(tarefas, max_concorrencia=MAX_CONCORRENCIA_PADRAO, ao_concluir=None):
+    # tarefas: dict {id: callable sem argumentos}. Devolve {id: resultado}.
+    # ao_concluir(id, resultado, concluidas, total) roda na thread chamadora,
+    # então pode atualizar widgets do Streamlit com segurança.
+    resultados = {}
+    if not tarefas:
+        return resultados
+
+    total = len(tarefas)
+    max_workers = max(1, min(int(max_concorrencia), total))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(funcao): tarefa_id for tarefa_id, funcao in tarefas.items()}
+        try:
+            for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+                tarefa_id = futuros[futuro]
+                resultados[tarefa_id] = futuro.result()
+                if ao_concluir is not None:
+                    ao_concluir(tarefa_id, resultados[tarefa_id], concluidas, total)
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+    return resultados
+
+
+_FIM = object()
+
+
+def executar_concorrente_em_fluxo(tarefas, max_concorrencia=MAX_CONCORRENCIA_PADRAO, ao_concluir=None):
+    # tarefas: dict {id: callable sem argumentos que devolve um iterável de
+    # trechos de texto}. Gera (id, trecho) na thread chamadora assim que cada
+    # trecho chega e (id, None) quando a tarefa termina; nesse momento
+    # ao_concluir(id, texto_completo, concluidas, total) é chamado.
+    if not tarefas:
+        return
+
+    fila = queue.Queue()
+    # Sinaliza às tarefas ainda em andamento que ninguém mais vai ler (erro
+    # em outra tarefa ou consumidor que desistiu do gerador).
+    cancelado = threading.Event()
+
+    def consumir(tarefa_id, funcao):
+        trechos = None
+        try:
+            if cancelado.is_set():
+                return
+            trechos = funcao()
+            for trecho in trechos:
+                fila.put((tarefa_id, trecho))
+                if cancelado.is_set():
+                    break
+        except BaseException as erro:
+            fila.put((tarefa_id, erro))
+        finally:
+            if hasattr(trechos, "close"):
+                trechos.close()
+            fila.put((tarefa_id, _FIM))
+
+    total = len(tarefas)
+    max_workers = max(1, min(int(max_concorrencia), total))
+    acumulado = {tarefa_id: [] for tarefa_id in tarefas}
+    concluidas = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for tarefa_id, funcao in tarefas.items():
+            executor.submit(consumir, tarefa_id, funcao)
+        try:
+            while concluidas < total:
+                tarefa_id, trecho = fila.get()
+                if trecho is _FIM:
+                    concluidas += 1
+                    if ao_concluir is not None:
+                        ao_concluir(tarefa_id, "".join(acumulado[tarefa_id]), concluidas, total)
+                    yield tarefa_id, None
+                    continue
+                if isinstance(trecho, BaseException):
+                    raise trecho
+                acumulado[tarefa_id].append(trecho)
+                yield tarefa_id, trecho
+        finally:
+            cancelado.set()
+
+
+def fluxo_em_ordem(eventos, ordem):
+    # Reordena os eventos (id, trecho) de executar_concorrente_em_fluxo:
+    # os trechos da tarefa ordem[i] só saem depois que ordem[i - 1] terminou,
+    # mas a tarefa da vez é repassada sem esperar pelo fim dela. O marcador
+    # (id, None) de fim de tarefa também é preservado.
+    pendentes = {tarefa_id: deque() for tarefa_id in ordem}
+    terminadas = set()
+    posicao = 0
+    ativos = iter(eventos)
+    while posicao < len(ordem):
+        atual = ordem[posicao]
+        if pendentes[atual]:
+            yield atual, pendentes[atual].popleft()
+            continue
+        if atual in terminadas:
+            yield atual, None
+            posicao += 1
+            continue
+        evento = next(ativos, None)
+        if evento is None:
+            terminadas.update(ordem)
+            continue
+        tarefa_id, trecho = evento
+        if trecho is None:
+            terminadas.add(tarefa_id)
+        else:
+            pendentes[tarefa_id].append(trecho)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from extracao import extensao_suportada, extrair_texto
+from maritaca import configurado
+from metricas import exportar_snapshot
+from pipeline import (
+    IDIOMAS,
+    MAX_CONCORRENCIA,
+    ORDEM_SECOES,
+    ModuloIncompleto,
+    chave_modulo,
+    escrever_saidas,
+    gerar_modulo,
+)
+
+MANIFESTO = ".escriba_lote.jsonl"
+SECOES_PADRAO = [s for s in ORDEM_SECOES if s != "resumo"]
+
+
+def listar_arquivos(entrada, recursivo):
+    if os.path.isfile(entrada):
+        return [entrada]
+    arquivos = []
+    for raiz, pastas, nomes in os.walk(entrada):
+        pastas.sort()
+        arquivos.extend(os.path.join(raiz, nome) for nome in sorted(nomes) if extensao_suportada(nome))
+        if not recursivo:
+            break
+    return arquivos
+
+
+def ler_manifesto(caminho):
+    # Última linha de cada chave vence; linhas truncadas por uma interrupção
+    # no meio da escrita são ignoradas.
+    concluidos = {}
+    if not os.path.exists(caminho):
+        return concluidos
+    with open(caminho, encoding="utf-8") as manifesto:
+        for linha in manifesto:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue
+            concluidos[registro["chave"]] = registro
+    return concluidos
+
+
+class Lote:
+
+    def __init__(self, entrada, saida, tema, idioma, secoes, formatos, workers, recursivo, traduzir=True):
+        self.entrada = entrada
+        self.saida = saida
+        self.tema = tema
+        self.idioma = idioma
+        self.secoes = secoes
+        self.formatos = formatos
+        self.workers = workers
+        self.traduzir = traduzir
+        self.arquivos = listar_arquivos(entrada, recursivo)
+        self.caminho_manifesto = os.path.join(saida, MANIFESTO)
+        self._manifesto_lock = threading.Lock()
+
+    def destino(self, caminho):
+        base = self.entrada if os.path.isdir(self.entrada) else os.path.dirname(self.entrada)
+        relativo = os.path.splitext(os.path.relpath(caminho, base))[0]
+        return os.path.join(self.saida, relativo)
+
+    def registrar(self, registro):
+        with self._manifesto_lock, open(self.caminho_manifesto, "a", encoding="utf-8") as manifesto:
+            manifesto.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def processar(self, caminho, concluidos):
+        inicio = time.perf_counter()
+        tema = self.tema or os.path.splitext(os.path.basename(caminho))[0]
+        with open(caminho, "rb") as arquivo:
+            extracao = extrair_texto(os.path.basename(caminho), arquivo.read(), identificar=True)
+        chave = chave_modulo(extracao.hash_conteudo, tema, self.idioma, self.secoes)
+        destino = self.destino(caminho)
+        saidas = [f"{destino}.{formato}" for formato in self.formatos]
+        if chave in concluidos and all(os.path.exists(s) for s in saidas):
+            return "pulado", time.perf_counter() - inicio
+
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        try:
+            texto_final, do_cache = gerar_modulo(
+                extracao.texto, extracao.hash_conteudo, tema, self.idioma, self.secoes, MAX_CONCORRENCIA,
+                traduzir=self.traduzir,
+            )
+        except ModuloIncompleto as incompleto:
+            # As saídas parciais são escritas (com as seções faltantes
+            # marcadas), mas o arquivo fica fora do manifesto: a próxima
+            # execução gera só o que faltou, o resto vem do cache.
+            escrever_saidas(incompleto.texto_final, destino, tema, self.idioma, self.formatos)
+            raise
+        escrever_saidas(texto_final, destino, tema, self.idioma, self.formatos)
+        self.registrar({"chave": chave, "arquivo": caminho, "saidas": saidas, "do_cache": do_cache})
+        return ("cache" if do_cache else "gerado"), time.perf_counter() - inicio
+
+    def executar(self):
+        os.makedirs(self.saida, exist_ok=True)
+        concluidos = ler_manifesto(self.caminho_manifesto)
+        falhas = 0
+        # Cada arquivo já paraleliza as próprias seções; o semáforo global do
+        # cliente Maritaca é o que de fato limita a vazão.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futuros = {executor.submit(self.processar, caminho, concluidos): caminho for caminho in self.arquivos}
+            for indice, futuro in enumerate(as_completed(futuros), start=1):
+                caminho = futuros[futuro]
+                try:
+                    situacao, segundos = futuro.result()
+                except ModuloIncompleto as e:
+                    falhas += 1
+                    print(f"[{indice}/{len(futuros)}] PARCIAL {caminho}: {e}", file=sys.stderr)
+                    continue
+                except Exception as e:
+                    # Erros da API e arquivos ilegíveis (PDF corrompido, DOCX
+                    # inválido) contam como falha do arquivo; o lote segue.
+                    falhas += 1
+                    print(f"[{indice}/{len(futuros)}] ERRO {caminho}: {str(e) or type(e).__name__}", file=sys.stderr)
+                    continue
+                print(f"[{indice}/{len(futuros)}] {situacao} {caminho} ({segundos:.1f}s)", file=sys.stderr)
+        return falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Gera módulos do Escriba para todos os arquivos (.pdf, .txt, .docx) de uma pasta."
+    )
+    parser.add_argument("entrada", help="Arquivo ou pasta com o material de base.")
+    parser.add_argument("saida", help="Pasta onde os módulos serão escritos.")
+    parser.add_argument("--tema", default="", help="Tema geral (padrão: nome de cada arquivo).")
+    parser.add_argument("--idioma", default="Português", choices=IDIOMAS)
+    parser.add_argument(
+        "--secoes",
+        default=",".join(SECOES_PADRAO),
+        help=f"Seções separadas por vírgula, entre: {', '.join(ORDEM_SECOES)}.",
+    )
+    parser.add_argument("--formatos", default="pdf,txt", help="Formatos de saída: pdf, txt.")
+    parser.add_argument("--workers", type=int, default=2, help="Arquivos processados em paralelo.")
+    parser.add_argument("--recursivo", action="store_true", help="Inclui subpastas.")
+    parser.add_argument("--metricas", help="Grava ao final um resumo JSON das métricas de desempenho neste caminho.")
+    parser.add_argument(
+        "--sem-traducao",
+        action="store_true",
+        help="Gera do material mesmo as seções já geradas em outro idioma (por padrão, são traduzidas).",
+    )
+    args = parser.parse_args(argv)
+
+    secoes = [s.strip() for s in args.secoes.split(",") if s.strip()]
+    invalidas = [s for s in secoes if s not in ORDEM_SECOES]
+    if invalidas or not secoes:
+        parser.error(f"Seções inválidas: {', '.join(invalidas) or '(nenhuma)'}")
+    if not configurado():
+        parser.error("Defina MARITACA_API_KEY no ambiente ou em .streamlit/secrets.toml.")
+
+    lote = Lote(
+        args.entrada,
+        args.saida,
+        args.tema,
+        args.idioma,
+        secoes,
+        [f.strip() for f in args.formatos.split(",") if f.strip()],
+        max(1, args.workers),
+        args.recursivo,
+        not args.sem_traducao,
+    )
+    if not lote.arquivos:
+        print("Nenhum arquivo suportado encontrado.", file=sys.stderr)
+        return 0
+    falhas = lote.executar()
+    if args.metricas:
+        exportar_snapshot(args.metricas)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
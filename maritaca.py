@@ -0,0 +1,507 @@
+import importlib
+import queue
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from itertools import chain
+from types import SimpleNamespace
+
+from configuracao import obter_config
+from metricas import medir, percentil, registrar
+from roteamento import rotear
+from tokens import estimar_tokens, estimar_tokens_mensagens
+
+BASE_URL = obter_config("MARITACA_BASE_URL", "https://chat.maritaca.ai/api")
+TIMEOUT_SEGUNDOS = float(obter_config("MARITACA_TIMEOUT", 120))
+MAX_TENTATIVAS = int(obter_config("MARITACA_MAX_TENTATIVAS", 4))
+BACKOFF_BASE_SEGUNDOS = float(obter_config("MARITACA_BACKOFF_BASE", 1.0))
+BACKOFF_MAX_SEGUNDOS = float(obter_config("MARITACA_BACKOFF_MAX", 30.0))
+MAX_CHAMADAS_SIMULTANEAS = int(obter_config("MARITACA_MAX_CHAMADAS_SIMULTANEAS", 8))
+MAX_CONEXOES = int(obter_config("MARITACA_MAX_CONEXOES", 32))
+# Chamada duplicada ("hedge"): quando o primeiro trecho de um stream demora
+# mais que o p95 recente da seção, uma segunda requisição igual é aberta e a
+# que responder primeiro segue; a outra é cancelada.
+HEDGE_ATIVO = str(obter_config("MARITACA_HEDGE", "1")).lower() not in ("0", "false", "nao", "não")
+HEDGE_MIN_AMOSTRAS = int(obter_config("MARITACA_HEDGE_MIN_AMOSTRAS", 20))
+HEDGE_MIN_SEGUNDOS = float(obter_config("MARITACA_HEDGE_MIN_SEGUNDOS", 1.0))
+# Respostas cortadas pelo max_tokens (finish_reason "length") são continuadas
+# em novas chamadas, até este número de vezes.
+MAX_CONTINUACOES = int(obter_config("MARITACA_MAX_CONTINUACOES", 3))
+PEDIDO_CONTINUACAO = (
+    "Sua resposta anterior foi interrompida pelo limite de tamanho. Continue exatamente de onde parou, "
+    "sem repetir nem resumir o que já foi escrito."
+)
+
+
+class ErroMaritaca(Exception):
+    pass
+
+
+class ErroConfiguracao(ErroMaritaca):
+    pass
+
+
+class ErroRequisicao(ErroMaritaca):
+    pass
+
+
+class ErroLimiteTaxa(ErroMaritaca):
+    pass
+
+
+class ErroServidor(ErroMaritaca):
+    pass
+
+
+class ErroConexao(ErroMaritaca):
+    pass
+
+
+class ErroPrazo(ErroMaritaca):
+    pass
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+# Limita as chamadas em voo no processo inteiro, somando todas as sessões.
+_semaforo = threading.BoundedSemaphore(MAX_CHAMADAS_SIMULTANEAS)
+
+
+def api_key():
+    return obter_config("MARITACA_API_KEY")
+
+
+def configurado():
+    return bool(api_key())
+
+
+def obter_cliente():
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            chave = api_key()
+            if not chave:
+                raise ErroConfiguracao("MARITACA_API_KEY não configurada. Defina-a em .streamlit/secrets.toml.")
+            try:
+                _cliente = _criar_cliente(chave)
+            except (ImportError, TypeError, ValueError) as erro:
+                raise ErroConfiguracao(f"Não foi possível criar o cliente da API Maritaca: {erro}") from erro
+        return _cliente
+
+
+def _modulo_http(openai):
+    # Biblioteca HTTP sobre a qual o openai instalado foi construído (httpx
+    # ou, nas versões novas, httpx2): os Limits do pool têm de ser dela.
+    for classe in openai.DefaultHttpxClient.__mro__:
+        raiz = classe.__module__.split(".")[0]
+        if raiz in ("httpx", "httpx2"):
+            return importlib.import_module(raiz)
+    raise ImportError("openai.DefaultHttpxClient não deriva de httpx nem de httpx2")
+
+
+def _criar_cliente(chave):
+    # openai e a biblioteca HTTP levam cerca de meio segundo para importar:
+    # só na primeira chamada, não na subida do app.
+    import openai
+
+    http = _modulo_http(openai)
+    return openai.OpenAI(
+        api_key=chave,
+        base_url=BASE_URL,
+        timeout=TIMEOUT_SEGUNDOS,
+        # As retentativas ficam por nossa conta (backoff com jitter e
+        # Retry-After), fora do semáforo.
+        max_retries=0,
+        http_client=openai.DefaultHttpxClient(
+            limits=http.Limits(
+                max_connections=MAX_CONEXOES,
+                max_keepalive_connections=MAX_CONEXOES,
+                keepalive_expiry=60.0,
+            ),
+        ),
+    )
+
+
+def _retry_after(erro):
+    resposta = getattr(erro, "response", None)
+    if resposta is None:
+        return None
+    valor = resposta.headers.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _traduzir_erro(erro):
+    # Devolve (exceção tipada, pode tentar de novo).
+    import openai
+
+    if isinstance(erro, openai.AuthenticationError):
+        return ErroConfiguracao(f"Chave da API recusada: {erro}"), False
+    if isinstance(erro, openai.RateLimitError):
+        return ErroLimiteTaxa(f"Limite de requisições da API atingido: {erro}"), True
+    if isinstance(erro, (openai.APITimeoutError, openai.APIConnectionError)):
+        return ErroConexao(f"Falha de conexão com a API: {erro}"), True
+    if isinstance(erro, openai.APIStatusError):
+        if erro.status_code >= 500:
+            return ErroServidor(f"Erro do servidor da API ({erro.status_code}): {erro}"), True
+        return ErroRequisicao(f"Requisição recusada pela API ({erro.status_code}): {erro}"), False
+    return ErroMaritaca(f"Erro na comunicação com a API: {erro}"), False
+
+
+def _espera(tentativa, erro):
+    retry_after = _retry_after(erro)
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX_SEGUNDOS) + random.uniform(0, BACKOFF_BASE_SEGUNDOS)
+    # Backoff exponencial com "full jitter".
+    return random.uniform(0, min(BACKOFF_MAX_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * 2 ** tentativa))
+
+
+def _restante(limite):
+    # Segundos até o prazo (instante de time.monotonic()); None sem prazo.
+    return None if limite is None else max(0.0, limite - time.monotonic())
+
+
+def _timeout(limite):
+    # Cada requisição espera no máximo o que falta do prazo.
+    restante = _restante(limite)
+    return TIMEOUT_SEGUNDOS if restante is None else max(0.001, min(TIMEOUT_SEGUNDOS, restante))
+
+
+def _verificar_prazo(limite, erro=None):
+    if limite is not None and time.monotonic() >= limite:
+        raise ErroPrazo("A chamada à API passou do prazo.") from erro
+
+
+def _cabe_no_prazo(limite, espera):
+    return limite is None or time.monotonic() + espera < limite
+
+
+def _criar(parametros, limite=None):
+    import openai
+
+    cliente = obter_cliente()
+    for tentativa in range(MAX_TENTATIVAS):
+        if not _semaforo.acquire(timeout=_restante(limite)):
+            raise ErroPrazo("A chamada à API passou do prazo esperando vaga.")
+        try:
+            return cliente.chat.completions.create(**parametros, timeout=_timeout(limite))
+        except openai.OpenAIError as erro:
+            ultimo = erro
+        finally:
+            _semaforo.release()
+        _verificar_prazo(limite, ultimo)
+        tipado, retentavel = _traduzir_erro(ultimo)
+        espera = _espera(tentativa, ultimo)
+        if not retentavel or tentativa == MAX_TENTATIVAS - 1 or not _cabe_no_prazo(limite, espera):
+            raise tipado from ultimo
+        time.sleep(espera)
+
+
+def _rota(secao, mensagens, modelo, max_tokens):
+    # Sem modelo ou max_tokens explícitos, vale a política de roteamento.
+    if modelo is None or max_tokens is None:
+        rota = rotear(secao, mensagens)
+        modelo = modelo or rota.modelo
+        max_tokens = max_tokens or rota.max_tokens
+    return modelo, max_tokens
+
+
+def _continuacao(mensagens, parcial):
+    return list(mensagens) + [
+        {"role": "assistant", "content": parcial},
+        {"role": "user", "content": PEDIDO_CONTINUACAO},
+    ]
+
+
+def completar(mensagens, modelo=None, max_tokens=None, temperature=0.7, secao=None, prazo=None, hedge=False):
+    # prazo: segundos para a chamada inteira, retentativas e continuações
+    # incluídas; passado o prazo, levanta ErroPrazo. Com hedge, a chamada vai
+    # em stream para poder ser duplicada e cancelada (ver completar_stream).
+    if hedge:
+        conteudo = "".join(completar_stream(mensagens, modelo, max_tokens, temperature, secao, prazo, hedge=True))
+        if not conteudo:
+            raise ErroMaritaca("A API devolveu uma resposta vazia.")
+        return conteudo
+    limite = time.monotonic() + prazo if prazo else None
+    modelo, max_tokens = _rota(secao, mensagens, modelo, max_tokens)
+    with medir("api", secao=secao, modelo=modelo, stream=False, max_tokens=max_tokens) as medicao:
+        partes = []
+        usos = []
+        conversa = mensagens
+        for continuacao in range(MAX_CONTINUACOES + 1):
+            response = _criar({
+                "model": modelo,
+                "messages": conversa,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            }, limite)
+            escolha = response.choices[0]
+            usos.append(getattr(response, "usage", None))
+            if escolha.message.content is None:
+                _anotar_uso(medicao, usos, mensagens, "".join(partes))
+                raise ErroMaritaca("A API devolveu uma resposta vazia.")
+            partes.append(escolha.message.content)
+            if not _continuar(medicao, escolha.finish_reason, continuacao):
+                break
+            conversa = _continuacao(mensagens, "".join(partes))
+        conteudo = "".join(partes)
+        _anotar_uso(medicao, usos, mensagens, conteudo)
+        return conteudo
+
+
+def _continuar(medicao, finish_reason, continuacao):
+    # Anota continuações e truncamento na medição; True para pedir mais.
+    if finish_reason != "length":
+        return False
+    if continuacao == MAX_CONTINUACOES:
+        medicao["truncado"] = True
+        return False
+    medicao["continuacoes"] = continuacao + 1
+    return True
+
+
+def _somar_uso(usos):
+    # None se alguma das chamadas veio sem uso.
+    if not usos or any(u is None or getattr(u, "prompt_tokens", None) is None for u in usos):
+        return None
+    return SimpleNamespace(
+        prompt_tokens=sum(u.prompt_tokens for u in usos),
+        completion_tokens=sum(u.completion_tokens for u in usos),
+    )
+
+
+def _anotar_uso(medicao, usos, mensagens, conteudo):
+    usage = _somar_uso(usos)
+    if usage is not None:
+        medicao["tokens_entrada"] = usage.prompt_tokens
+        medicao["tokens_saida"] = usage.completion_tokens
+    else:
+        medicao["tokens_entrada"] = estimar_tokens_mensagens(mensagens)
+        medicao["tokens_saida"] = estimar_tokens(conteudo)
+        medicao["tokens_estimados"] = True
+
+
+def _abrir_stream(cliente, parametros, limite=None, tentativas=MAX_TENTATIVAS, bloquear=True):
+    # Abre o stream com retentativas e o devolve segurando uma vaga do
+    # semáforo, devolvida por quem o fecha. Sem bloquear, desiste se não houver
+    # vaga livre: a duplicata de uma chamada lenta não disputa vaga com
+    # chamadas novas.
+    import openai
+
+    for tentativa in range(tentativas):
+        if not bloquear:
+            if not _semaforo.acquire(blocking=False):
+                raise ErroMaritaca("Sem vaga livre para duplicar a chamada.")
+        elif not _semaforo.acquire(timeout=_restante(limite)):
+            raise ErroPrazo("A chamada à API passou do prazo esperando vaga.")
+        try:
+            return cliente.chat.completions.create(**parametros, timeout=_timeout(limite))
+        except openai.OpenAIError as erro:
+            ultimo = erro
+        except BaseException:
+            # Qualquer outra exceção também devolve a vaga; sem isso ela se
+            # perderia até o processo reiniciar.
+            _semaforo.release()
+            raise
+        _semaforo.release()
+        _verificar_prazo(limite, ultimo)
+        tipado, retentavel = _traduzir_erro(ultimo)
+        espera = _espera(tentativa, ultimo)
+        if not retentavel or tentativa == tentativas - 1 or not _cabe_no_prazo(limite, espera):
+            raise tipado from ultimo
+        time.sleep(espera)
+
+
+class _Tentativa:
+    # Uma requisição em stream disputando o primeiro trecho (ver
+    # completar_stream). A thread dela lê até o primeiro trecho com conteúdo;
+    # a vencedora continua sendo lida pela thread chamadora.
+
+    def __init__(self, abrir):
+        self._abrir = abrir
+        self._stream = None
+        self._cancelada = False
+        self._lock = threading.Lock()
+        self.lidos = []
+        self.erro = None
+
+    def executar(self, fila):
+        cancelada = False
+        try:
+            stream = self._abrir()
+            with self._lock:
+                self._stream = stream
+                cancelada = self._cancelada
+            if not cancelada:
+                for chunk in stream:
+                    self.lidos.append(chunk)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        break
+        except Exception as erro:
+            self.erro = erro
+        if self.erro is not None or cancelada:
+            self.fechar()
+        fila.put(self)
+
+    def restante(self):
+        return chain(self.lidos, self._stream or ())
+
+    def fechar(self):
+        # Fecha a conexão e devolve a vaga do semáforo. Numa perdedora que
+        # ainda espera a resposta, o fechamento acontece quando a requisição
+        # volta. Pode ser chamada mais de uma vez.
+        with self._lock:
+            self._cancelada = True
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            finally:
+                _semaforo.release()
+
+
+def _limiar_hedge(secao):
+    # p95 do tempo até o primeiro trecho nas chamadas recentes da seção; sem
+    # amostras suficientes, não há duplicata.
+    limiar = percentil("api", 95, secao=secao, campo="segundos_primeiro_token", min_amostras=HEDGE_MIN_AMOSTRAS)
+    return None if limiar is None else max(limiar, HEDGE_MIN_SEGUNDOS)
+
+
+def _levantar(erro):
+    import openai
+
+    if isinstance(erro, openai.OpenAIError):
+        raise _traduzir_erro(erro)[0] from erro
+    raise erro
+
+
+def _stream_disputado(cliente, parametros, limite, limiar, medicao, fim):
+    # Gera os chunks de uma chamada em stream. Com limiar (segundos), se o
+    # primeiro trecho não chega a tempo, abre uma duplicata; segue a primeira
+    # a responder e a outra é fechada. Ao terminar, fim guarda "usage" e
+    # "finish_reason".
+    import openai
+
+    inicio = time.perf_counter()
+    tentativas = []
+    fila = queue.Queue()
+
+    def disparar(**opcoes):
+        tentativa = _Tentativa(lambda: _abrir_stream(cliente, parametros, limite, **opcoes))
+        tentativas.append(tentativa)
+        threading.Thread(target=tentativa.executar, args=(fila,), daemon=True).start()
+
+    try:
+        disparar()
+        vencedora = None
+        respondidas = 0
+        while vencedora is None:
+            espera = _restante(limite)
+            if limiar is not None:
+                ate_limiar = max(0.0, limiar - (time.perf_counter() - inicio))
+                espera = ate_limiar if espera is None else min(espera, ate_limiar)
+            try:
+                tentativa = fila.get(timeout=espera)
+            except queue.Empty:
+                if limiar is None or not _cabe_no_prazo(limite, 0):
+                    raise ErroPrazo("A chamada à API passou do prazo.")
+                disparar(tentativas=1, bloquear=False)
+                medicao["hedge"] = True
+                limiar = None
+                continue
+            respondidas += 1
+            if tentativa.erro is None:
+                vencedora = tentativa
+            elif respondidas == len(tentativas):
+                # Todas falharam: vale o erro da original.
+                _levantar(tentativas[0].erro)
+        if len(tentativas) > 1:
+            medicao["hedge_venceu"] = vencedora is not tentativas[0]
+        for perdedora in tentativas:
+            if perdedora is not vencedora:
+                perdedora.fechar()
+
+        try:
+            for chunk in vencedora.restante():
+                if getattr(chunk, "usage", None) is not None:
+                    fim["usage"] = chunk.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    fim["finish_reason"] = chunk.choices[0].finish_reason
+                yield chunk
+                _verificar_prazo(limite)
+        except openai.OpenAIError as erro:
+            _verificar_prazo(limite, erro)
+            raise _traduzir_erro(erro)[0] from erro
+    finally:
+        for tentativa in tentativas:
+            tentativa.fechar()
+
+
+def completar_stream(mensagens, modelo=None, max_tokens=None, temperature=0.7, secao=None, prazo=None,
+                     hedge=HEDGE_ATIVO):
+    # As retentativas só cobrem a abertura do stream; uma falha depois do
+    # primeiro trecho sobe como ErroConexao para não duplicar texto. prazo
+    # (segundos) vale para a chamada inteira: passado, levanta ErroPrazo.
+    # Com hedge, se o primeiro trecho não chega até o p95 da seção, uma
+    # duplicata é aberta (ver _stream_disputado). Uma resposta cortada pelo
+    # max_tokens continua, no mesmo gerador, numa nova chamada.
+    inicio = time.perf_counter()
+    limite = time.monotonic() + prazo if prazo else None
+    modelo, max_tokens = _rota(secao, mensagens, modelo, max_tokens)
+    medicao = {"secao": secao, "modelo": modelo, "stream": True, "max_tokens": max_tokens}
+    partes = []
+    usos = []
+    try:
+        cliente = obter_cliente()
+        conversa = mensagens
+        for continuacao in range(MAX_CONTINUACOES + 1):
+            parametros = {
+                "model": modelo,
+                "messages": conversa,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stream": True,
+            }
+            fim = {}
+            limiar = _limiar_hedge(secao) if hedge else None
+            chunks = _stream_disputado(cliente, parametros, limite, limiar, medicao, fim)
+            try:
+                for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not partes:
+                            medicao["segundos_primeiro_token"] = round(time.perf_counter() - inicio, 6)
+                        partes.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                chunks.close()
+            usos.append(fim.get("usage"))
+            if not _continuar(medicao, fim.get("finish_reason"), continuacao):
+                break
+            conversa = _continuacao(mensagens, "".join(partes))
+    except BaseException as erro:
+        medicao["erro"] = type(erro).__name__
+        raise
+    finally:
+        _anotar_uso(medicao, usos, mensagens, "".join(partes))
+        registrar("api", time.perf_counter() - inicio, **medicao)
+
+
+def chat_with_bot(user_input, preprompt, modelo=None, secao=None, prazo=None, hedge=False):
+    return completar(
+        [preprompt, {"role": "user", "content": user_input}], modelo=modelo, secao=secao, prazo=prazo, hedge=hedge
+    )
+
+
+def chat_with_bot_stream(user_input, preprompt, modelo=None, secao=None, prazo=None):
+    return completar_stream(
+        [preprompt, {"role": "user", "content": user_input}], modelo=modelo, secao=secao, prazo=prazo
+    )
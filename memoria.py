@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+from configuracao import obter_config
+from tokens import estimar_tokens
+
+# Histórico das conversas num JSONL só de acréscimos: cada linha é um turno
+# ou um resumo. O chat_memory.json antigo é importado como conversa "legado"
+# na primeira vez que o arquivo novo é criado.
+CAMINHO_MEMORIA = obter_config("ESCRIBA_MEMORIA_PATH", os.path.join(".cache", "chat_memory.jsonl"))
+CAMINHO_LEGADO = "chat_memory.json"
+MAX_TOKENS_JANELA = int(obter_config("ESCRIBA_MEMORIA_MAX_TOKENS", 3000))
+# Turnos que saíram da janela só viram resumo quando somam ao menos isto, para
+# não gastar uma chamada de API a cada mensagem.
+MIN_TOKENS_RESUMO = int(obter_config("ESCRIBA_MEMORIA_MIN_TOKENS_RESUMO", 800))
+# Acima deste tamanho (e do dobro do resultado da última compactação) o
+# arquivo é reescrito só com o estado vivo.
+MAX_BYTES_ARQUIVO = int(obter_config("ESCRIBA_MEMORIA_MAX_BYTES", 8 * 1024 * 1024))
+
+
+def _nova_conversa():
+    return {"turnos": [], "resumo": None, "proximo_seq": 0}
+
+
+class MemoriaConversas:
+
+    def __init__(self, caminho=CAMINHO_MEMORIA, caminho_legado=CAMINHO_LEGADO):
+        self.caminho = caminho
+        self._conversas = {}
+        self._posicao = 0
+        self._inode = None
+        self._tamanho_compactado = 0
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        if not os.path.exists(caminho):
+            with open(caminho, "a", encoding="utf-8"):
+                pass
+            if caminho_legado and os.path.exists(caminho_legado):
+                with open(caminho_legado, encoding="utf-8") as arquivo:
+                    for mensagem in json.load(arquivo):
+                        self.adicionar("legado", mensagem["role"], mensagem["content"])
+
+    def _aplicar(self, registro):
+        conversa = self._conversas.setdefault(registro["conversa"], _nova_conversa())
+        if registro["tipo"] == "turno":
+            conversa["turnos"].append(registro)
+            conversa["proximo_seq"] = max(conversa["proximo_seq"], registro["seq"] + 1)
+        elif registro["tipo"] == "resumo":
+            conversa["resumo"] = registro
+            conversa["turnos"] = [t for t in conversa["turnos"] if t["seq"] > registro["ate"]]
+        elif registro["tipo"] == "apagar":
+            self._conversas.pop(registro["conversa"], None)
+
+    def _carregar_novos(self):
+        # Lê só o que foi acrescentado desde a última leitura, inclusive por
+        # outros processos. Se o arquivo foi compactado, relê do início.
+        with open(self.caminho, "rb") as arquivo:
+            info = os.fstat(arquivo.fileno())
+            if info.st_ino != self._inode or info.st_size < self._posicao:
+                self._conversas = {}
+                self._posicao = 0
+                self._inode = info.st_ino
+            arquivo.seek(self._posicao)
+            for linha in arquivo:
+                if not linha.endswith(b"\n"):
+                    break
+                self._posicao += len(linha)
+                self._aplicar(json.loads(linha))
+
+    def _anexar(self, registro):
+        linha = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.caminho, "ab") as arquivo:
+            arquivo.write(linha)
+        self._carregar_novos()
+
+    def adicionar(self, conversa_id, role, content):
+        with self._lock:
+            self._carregar_novos()
+            seq = self._conversas.get(conversa_id, _nova_conversa())["proximo_seq"]
+            self._anexar({
+                "conversa": conversa_id, "tipo": "turno", "seq": seq,
+                "role": role, "content": content, "ts": time.time(),
+            })
+            tamanho = os.path.getsize(self.caminho)
+            if tamanho > MAX_BYTES_ARQUIVO and tamanho > 2 * self._tamanho_compactado:
+                self._compactar()
+
+    def apagar(self, conversa_id):
+        with self._lock:
+            self._anexar({"conversa": conversa_id, "tipo": "apagar", "ts": time.time()})
+
+    def historico(self, conversa_id):
+        with self._lock:
+            self._carregar_novos()
+            conversa = self._conversas.get(conversa_id, _nova_conversa())
+            return (conversa["resumo"] or {}).get("content"), [
+                {"role": t["role"], "content": t["content"]} for t in conversa["turnos"]
+            ]
+
+    def janela(self, conversa_id, max_tokens=MAX_TOKENS_JANELA, resumidor=None):
+        # Mensagens para mandar à API: o resumo dos turnos antigos (se houver)
+        # e os turnos mais recentes que cabem em max_tokens. Com um
+        # resumidor(mensagens) -> texto, os turnos que ficaram de fora são
+        # incorporados ao resumo.
+        with self._lock:
+            self._carregar_novos()
+            conversa = self._conversas.get(conversa_id, _nova_conversa())
+            resumo = conversa["resumo"]
+            turnos = list(conversa["turnos"])
+
+        orcamento = max_tokens - (estimar_tokens(resumo["content"]) if resumo else 0)
+        escolhidos = []
+        for turno in reversed(turnos):
+            tokens = estimar_tokens(turno["content"]) + 4
+            if tokens > orcamento:
+                break
+            orcamento -= tokens
+            escolhidos.append(turno)
+        escolhidos.reverse()
+        fora = turnos[:len(turnos) - len(escolhidos)]
+
+        if resumidor is not None and fora and sum(estimar_tokens(t["content"]) for t in fora) >= MIN_TOKENS_RESUMO:
+            mensagens = [{"role": t["role"], "content": t["content"]} for t in fora]
+            if resumo:
+                mensagens.insert(0, {"role": "system", "content": "Resumo anterior:\n" + resumo["content"]})
+            resumo = {
+                "conversa": conversa_id, "tipo": "resumo", "ate": fora[-1]["seq"],
+                "content": resumidor(mensagens), "ts": time.time(),
+            }
+            with self._lock:
+                self._anexar(resumo)
+
+        janela = [{"role": t["role"], "content": t["content"]} for t in escolhidos]
+        if resumo:
+            janela.insert(0, {"role": "system", "content": "Resumo da conversa até aqui:\n" + resumo["content"]})
+        return janela
+
+    def compactar(self):
+        with self._lock:
+            self._carregar_novos()
+            self._compactar()
+
+    def _compactar(self):
+        # Reescreve o arquivo só com o último resumo e os turnos posteriores de
+        # cada conversa; a troca com os.replace é atômica.
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            for conversa in self._conversas.values():
+                registros = ([conversa["resumo"]] if conversa["resumo"] else []) + conversa["turnos"]
+                for registro in registros:
+                    arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        os.replace(temporario, self.caminho)
+        self._tamanho_compactado = os.path.getsize(self.caminho)
+        self._inode = None
+        self._carregar_novos()
+
+
+_memoria = None
+_memoria_lock = threading.Lock()
+
+
+def obter_memoria():
+    global _memoria
+    with _memoria_lock:
+        if _memoria is None:
+            _memoria = MemoriaConversas()
+        return _memoria
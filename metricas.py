@@ -0,0 +1,123 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from configuracao import obter_config
+
+# Log estruturado opcional: um evento JSON por linha.
+CAMINHO_LOG = obter_config("ESCRIBA_METRICAS_LOG")
+MAX_EVENTOS = int(obter_config("ESCRIBA_METRICAS_MAX_EVENTOS", 5000))
+
+_eventos = deque(maxlen=MAX_EVENTOS)
+_totais = defaultdict(lambda: defaultdict(float))
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def _nome(evento):
+    return evento.get("secao") or evento.get("namespace") or evento.get("modulo") or "-"
+
+
+def registrar(tipo, segundos, **campos):
+    evento = {"ts": time.time(), "tipo": tipo, "segundos": round(segundos, 6)}
+    evento.update({k: v for k, v in campos.items() if v is not None})
+    with _lock:
+        _eventos.append(evento)
+        totais = _totais[(tipo, _nome(evento))]
+        totais["chamadas"] += 1
+        totais["segundos"] += segundos
+        for campo in ("tokens_entrada", "tokens_saida"):
+            totais[campo] += evento.get(campo, 0)
+        if "erro" in evento:
+            totais["erros"] += 1
+        if evento.get("hedge"):
+            totais["duplicadas"] += 1
+        if "cache" in evento:
+            totais["cache_" + evento["cache"]] += 1
+    if CAMINHO_LOG:
+        with _log_lock, open(CAMINHO_LOG, "a", encoding="utf-8") as log:
+            log.write(json.dumps(evento, ensure_ascii=False) + "\n")
+    return evento
+
+
+def contar(tipo, nome, campo):
+    # Só soma nos totais, sem evento no anel nem no log: consultas ao cache
+    # são muitas e expulsariam do anel as amostras que percentil usa.
+    with _lock:
+        totais = _totais[(tipo, nome)]
+        totais["chamadas"] += 1
+        totais[campo] += 1
+
+
+@contextmanager
+def medir(tipo, **campos):
+    # Uso: with medir("api", secao="glossario") as m: ...; m["tokens_saida"] = n
+    # Exceções são registradas (campo "erro") e repassadas.
+    inicio = time.perf_counter()
+    try:
+        yield campos
+    except BaseException as erro:
+        campos["erro"] = type(erro).__name__
+        raise
+    finally:
+        registrar(tipo, time.perf_counter() - inicio, **campos)
+
+
+def _percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+def percentil(tipo, p, secao=None, campo="segundos", min_amostras=1):
+    # None com menos de min_amostras eventos que tenham o campo.
+    with _lock:
+        valores = sorted(
+            e[campo] for e in _eventos
+            if e["tipo"] == tipo and "erro" not in e and campo in e and (secao is None or e.get("secao") == secao)
+        )
+    if len(valores) < min_amostras:
+        return None
+    return _percentil(valores, p)
+
+
+def snapshot():
+    with _lock:
+        eventos = list(_eventos)
+        totais = {chave: dict(valores) for chave, valores in _totais.items()}
+
+    duracoes = defaultdict(list)
+    for evento in eventos:
+        if "erro" not in evento:
+            duracoes[(evento["tipo"], _nome(evento))].append(evento["segundos"])
+
+    grupos = []
+    for (tipo, nome), valores in sorted(totais.items()):
+        amostras = sorted(duracoes.get((tipo, nome), []))
+        grupos.append({
+            "tipo": tipo,
+            "nome": nome,
+            "chamadas": int(valores.get("chamadas", 0)),
+            "erros": int(valores.get("erros", 0)),
+            "duplicadas": int(valores.get("duplicadas", 0)),
+            "segundos_total": round(valores.get("segundos", 0.0), 3),
+            "p50": _percentil(amostras, 50),
+            "p95": _percentil(amostras, 95),
+            "tokens_entrada": int(valores.get("tokens_entrada", 0)),
+            "tokens_saida": int(valores.get("tokens_saida", 0)),
+            "cache": {k[len("cache_"):]: int(v) for k, v in valores.items() if k.startswith("cache_")},
+        })
+    return {"gerado_em": time.time(), "eventos_recentes": len(eventos), "grupos": grupos}
+
+
+def snapshot_json(dados=None):
+    return json.dumps(dados or snapshot(), ensure_ascii=False, indent=2)
+
+
+def exportar_snapshot(caminho):
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write(snapshot_json())
@@ -0,0 +1,153 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+from metricas import medir
+
+# O reportlab só é importado quando o primeiro PDF é pedido, fora da subida
+# do app.
+
+BASE_FONT = "Helvetica"
+MAX_PDFS_MEMORIA = 32
+
+_pdfs = OrderedDict()
+_pdfs_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def estilos_pdf():
+    # Montada uma vez por processo; as platypus só leem os estilos.
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        name="TitleMain",
+        parent=styles["Title"],
+        fontName=BASE_FONT,
+        fontSize=20,
+        leading=24,
+        alignment=TA_CENTER,
+        spaceAfter=18,
+    ))
+    styles.add(ParagraphStyle(
+        name="ModuleMeta",
+        parent=styles["Normal"],
+        fontName=BASE_FONT,
+        fontSize=10,
+        leading=12,
+        alignment=TA_CENTER,
+        textColor="#666666",
+        spaceAfter=12,
+    ))
+    styles.add(ParagraphStyle(
+        name="HeadingSection",
+        parent=styles["Heading2"],
+        fontName=BASE_FONT,
+        fontSize=14,
+        leading=18,
+        spaceBefore=12,
+        spaceAfter=6,
+    ))
+    styles.add(ParagraphStyle(
+        name="EscribaBody",
+        parent=styles["Normal"],
+        fontName=BASE_FONT,
+        fontSize=11,
+        leading=15,
+        spaceBefore=6,
+        spaceAfter=6,
+        alignment=TA_LEFT,
+    ))
+    styles.add(ParagraphStyle(
+        name="FooterSmall",
+        parent=styles["Normal"],
+        fontName=BASE_FONT,
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        textColor="#777777",
+    ))
+    return styles
+
+
+def _draw_page(canvas, doc):
+    from reportlab.lib.pagesizes import A4
+
+    canvas.saveState()
+    w, h = A4
+    footer_text = "Escriba — Gerador de Módulo Educacional"
+    page_num = f"Página {doc.page}"
+    canvas.setFont(BASE_FONT, 8)
+    canvas.setFillColorRGB(0.4, 0.4, 0.4)
+    canvas.drawCentredString(w / 2.0, 20, footer_text + "    •    " + page_num)
+    canvas.restoreState()
+
+
+def escrever_pdf_modulo(destino, texto_final, titulo_modulo, idioma):
+    # destino é qualquer arquivo binário (BytesIO, arquivo em disco...); o
+    # reportlab escreve nele diretamente.
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+
+    styles = estilos_pdf()
+    doc_pdf = SimpleDocTemplate(
+        destino,
+        pagesize=A4,
+        rightMargin=48,
+        leftMargin=48,
+        topMargin=56,
+        bottomMargin=56,
+    )
+
+    story = []
+    story.append(Paragraph("Escriba — Gerador de Módulo", styles["TitleMain"]))
+    story.append(Paragraph(titulo_modulo, styles["HeadingSection"]))
+    meta = f"Idioma: {idioma} • Gerado: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+    story.append(Paragraph(meta, styles["ModuleMeta"]))
+    story.append(Spacer(1, 0.2 * inch))
+    story.append(PageBreak())
+
+    for sec in [s.strip() for s in texto_final.split("\n\n") if s.strip()]:
+        linhas = sec.split("\n")
+        heading = linhas[0].strip()
+        body_lines = linhas[1:]
+        story.append(Paragraph(heading, styles["HeadingSection"]))
+        body_text = "\n".join(body_lines).strip()
+        if body_text:
+            paras = [p.strip() for p in body_text.split("\n\n") if p.strip()]
+            for p in paras:
+                story.append(Paragraph(p.replace("\n", "<br/>"), styles["EscribaBody"]))
+        story.append(Spacer(1, 0.12 * inch))
+
+    doc_pdf.build(story, onFirstPage=_draw_page, onLaterPages=_draw_page)
+
+
+def chave_pdf(texto_final, titulo_modulo, idioma):
+    return hashlib.sha256("\0".join([texto_final, titulo_modulo, idioma]).encode("utf-8")).hexdigest()
+
+
+def renderizar_pdf_modulo(texto_final, titulo_modulo, idioma):
+    # Memoizado por hash do conteúdo: reruns do Streamlit e sessões que
+    # pedem o mesmo módulo reaproveitam os bytes já renderizados.
+    chave = chave_pdf(texto_final, titulo_modulo, idioma)
+    with _pdfs_lock:
+        if chave in _pdfs:
+            _pdfs.move_to_end(chave)
+            return _pdfs[chave]
+
+    with medir("pdf", caracteres=len(texto_final)) as medicao:
+        buffer_pdf = BytesIO()
+        escrever_pdf_modulo(buffer_pdf, texto_final, titulo_modulo, idioma)
+        pdf_bytes = buffer_pdf.getvalue()
+        medicao["bytes"] = len(pdf_bytes)
+
+    with _pdfs_lock:
+        _pdfs[chave] = pdf_bytes
+        while len(_pdfs) > MAX_PDFS_MEMORIA:
+            _pdfs.popitem(last=False)
+    return pdf_bytes
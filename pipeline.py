@@ -0,0 +1,486 @@
+import os
+
+from cache import chave_cache, obter_cache
+from configuracao import obter_config
+from contexto import ORCAMENTO_PADRAO, ORCAMENTO_SECAO, contexto_para_secao, obter_digest
+from extracao import links_do_arquivo
+from extracao_local import (
+    MIN_CANDIDATOS_GLOSSARIO,
+    candidatos_glossario,
+    contexto_glossario,
+    extrair_links,
+    formatar_links,
+)
+from geracao import executar_concorrente, executar_concorrente_em_fluxo
+from maritaca import HEDGE_ATIVO, ErroMaritaca, chat_with_bot, chat_with_bot_stream, completar
+from memoria import obter_memoria
+from metricas import medir
+from pdf_modulo import escrever_pdf_modulo
+from roteamento import assinatura
+from tokens import estimar_tokens, estimar_tokens_mensagens
+
+
+def criar_preprompt(texto, idioma):
+    idioma_text = f"Idioma de saída: {idioma}.\n\n"
+    return {
+        "role": "system",
+        "content": (
+            "Você é um assistente especialista em design educacional e criação de conteúdo. "
+            + idioma_text
+            + f"{texto}"
+        )
+    }
+
+
+def prompt_glossario(conteudo):
+    return (
+        "Seção 3. Glossário geral\n\n"
+        "Com base no texto abaixo, identifique as palavras ou termos difíceis, técnicos ou pouco usuais para o público geral. "
+        "Se vier uma lista de termos candidatos, escolha entre eles e defina-os no sentido das frases citadas. "
+        "Apresente no formato: N°:\\tTermo:\\tDefinição / significado. Texto base:\n" + conteudo
+    )
+
+
+def prompt_links_anexos(conteudo):
+    return (
+        "Seção 4. Links de materiais complementares e anexos\n\n"
+        "Extraia apenas os links e anexos citados no texto. Conteúdo base:\n" + conteudo
+    )
+
+
+def build_texto_final(secoes):
+    return "\n\n".join(secoes)
+
+
+# "versao" entra na chave de cache da seção: ao mudar o prompt de uma seção,
+# incremente a versão dela para invalidar só os resultados dela.
+SECOES = {
+    "resumo": {
+        "tag": "R",
+        "versao": 1,
+        "titulo": "Seção 0. Resumo geral aprofundado",
+        "prompt": (
+            "Seção 0. Resumo geral aprofundado\n\n"
+            "Faça um resumo aprofundado do material, sintetizando os pontos principais e destacando aplicações práticas."
+        ),
+    },
+    "introducao": {
+        "tag": "I",
+        "versao": 1,
+        "titulo": "Seção 1. Introdução ao conteúdo",
+        "prompt": (
+            "Seção 1. Introdução ao conteúdo\n\n"
+            "Redija um texto introdutório para um módulo educacional com pelo menos 3 parágrafos."
+        ),
+    },
+    "unidades": {
+        "tag": "U",
+        "versao": 1,
+        "titulo": "Seção 2. Unidades de aprendizagem do Módulo",
+        "prompt": "Seção 2. Unidades de aprendizagem do Módulo\n\nDesenvolva as unidades principais.",
+    },
+    "glossario": {
+        "tag": "G",
+        "versao": 2,
+        "titulo": "Seção 3. Glossário geral",
+    },
+    "links": {
+        "tag": "L",
+        "versao": 2,
+        "titulo": "Seção 4. Links de materiais complementares e anexos",
+    },
+    "conclusao": {
+        "tag": "C",
+        "versao": 1,
+        "titulo": "Seção 5. Unidade de conclusão do módulo",
+        "prompt": "Seção 5. Unidade de conclusão do módulo\n\nResuma e incentive a aplicação do conhecimento.",
+    },
+    "referencias": {
+        "tag": "F",
+        "versao": 1,
+        "titulo": "Seção 6. Referências do Módulo",
+        "prompt": "Seção 6. Referências do Módulo\n\nExtraia referências presentes no conteúdo.",
+    },
+}
+ORDEM_SECOES = list(SECOES)
+IDIOMAS = ["Português", "Inglês"]
+MAX_CONCORRENCIA = int(obter_config("ESCRIBA_MAX_CONCORRENCIA", len(SECOES)))
+# Prazo de cada seção, retentativas incluídas; ESCRIBA_PRAZO_<SECAO> (por
+# exemplo, ESCRIBA_PRAZO_UNIDADES) muda o de uma seção só. 0 desliga.
+PRAZO_SECAO = float(obter_config("ESCRIBA_PRAZO_SECAO", 180))
+MAX_CARACTERES_MOTIVO = 200
+
+
+class ModuloIncompleto(ErroMaritaca):
+    # Algumas seções não foram geradas (prazo ou erro da API). texto_final
+    # já traz as que faltam marcadas; as geradas estão no cache.
+
+    def __init__(self, texto_final, faltantes):
+        super().__init__("Seções não geradas: " + ", ".join(SECOES[secao_id]["titulo"] for secao_id in faltantes))
+        self.texto_final = texto_final
+        self.faltantes = faltantes
+
+
+def prazo_secao(secao_id):
+    return float(obter_config(f"ESCRIBA_PRAZO_{secao_id.upper()}", PRAZO_SECAO)) or None
+
+
+def prompt_traducao(secao_id, texto, idioma_origem):
+    # Só a seção pronta vai para a API, sem o material de base; o idioma de
+    # destino vem no preprompt.
+    return (
+        f"{SECOES[secao_id]['titulo']}\n\n"
+        f"Traduza a seção abaixo, escrita em {idioma_origem}, para o idioma de saída. "
+        "Mantenha a estrutura, a numeração, os links e as referências; entregue apenas a tradução.\n\nTexto:\n"
+        + texto
+    )
+
+
+def prompt_secao(secao_id, tema_geral, contexto):
+    if secao_id == "glossario":
+        return prompt_glossario(f"{tema_geral}\n{contexto}")
+    if secao_id == "links":
+        return prompt_links_anexos(contexto)
+    if contexto:
+        return SECOES[secao_id]["prompt"] + "\n\nMaterial de base:\n" + contexto
+    return SECOES[secao_id]["prompt"]
+
+
+def contexto_glossario_local(texto_origem):
+    # O modelo só define uma lista curta de termos escolhidos localmente, em
+    # vez de ler o material. None quando há poucos candidatos.
+    with medir("local", secao="glossario") as medicao:
+        candidatos = candidatos_glossario(texto_origem)
+        medicao["candidatos"] = len(candidatos)
+    if len(candidatos) < MIN_CANDIDATOS_GLOSSARIO:
+        return None
+    return contexto_glossario(candidatos)
+
+
+def montar_contextos(secoes_ids, texto_origem, file_hash):
+    # Cada seção recebe só o recorte do material de que precisa; o digest
+    # (tópicos, trechos, termos) é calculado uma vez por arquivo e fica no cache.
+    digest = None
+    if texto_origem and estimar_tokens(texto_origem) > min(ORCAMENTO_SECAO.get(s, ORCAMENTO_PADRAO) for s in secoes_ids):
+        digest = obter_digest(file_hash, texto_origem)
+    contextos = {secao_id: contexto_para_secao(secao_id, texto_origem, digest) for secao_id in secoes_ids}
+    if "glossario" in contextos and texto_origem:
+        local = contexto_glossario_local(texto_origem)
+        if local and len(local) < len(contextos["glossario"]):
+            contextos["glossario"] = local
+    return contextos
+
+
+def secao_links_local(texto_origem, file_hash, idioma):
+    # Links, DOIs e anexos achados no texto e nas anotações do arquivo. None
+    # quando não há nenhum: aí o modelo tenta (referências sem URL, etc.).
+    with medir("local", secao="links") as medicao:
+        encontrados = extrair_links(texto_origem, links_do_arquivo(file_hash) if file_hash else ())
+        medicao["itens"] = sum(len(itens) for itens in encontrados.values())
+    return formatar_links(encontrados, idioma) or None
+
+
+# Seções que podem sair de uma etapa local, sem API. Cada uma recebe
+# (texto_origem, file_hash, idioma) e devolve o texto da seção ou None para
+# cair na geração pelo modelo.
+ETAPAS_LOCAIS = {
+    "links": secao_links_local,
+}
+
+
+def resolver_localmente(secoes_ids, texto_origem, file_hash, idioma):
+    if not texto_origem:
+        return {}
+    resolvidas = {}
+    for secao_id in secoes_ids:
+        etapa = ETAPAS_LOCAIS.get(secao_id)
+        texto = etapa(texto_origem, file_hash, idioma) if etapa else None
+        if texto:
+            resolvidas[secao_id] = texto
+    return resolvidas
+
+
+def chamada_secao(secao_id, tema_geral, contextos, traducao=None):
+    # (prompt, seção do roteamento). traducao: (idioma_origem, {secao_id:
+    # texto}); as seções que ela traz são traduzidas em vez de geradas.
+    if traducao and secao_id in traducao[1]:
+        return prompt_traducao(secao_id, traducao[1][secao_id], traducao[0]), "traducao"
+    return prompt_secao(secao_id, tema_geral, contextos[secao_id]), secao_id
+
+
+def estimar_entrada(secoes_ids, preprompt, tema_geral, contextos, traducao=None):
+    return {
+        secao_id: estimar_tokens_mensagens([
+            preprompt, {"role": "user", "content": chamada_secao(secao_id, tema_geral, contextos, traducao)[0]}
+        ])
+        for secao_id in secoes_ids
+    }
+
+
+def _motivo(erro):
+    return str(erro)[:MAX_CARACTERES_MOTIVO]
+
+
+def _tolerante(secao_id, funcao, falhas):
+    # Com falhas (dict), a seção que falha fica de fora com o motivo em
+    # falhas[secao_id], sem derrubar as outras.
+    if falhas is None:
+        return funcao
+
+    def tarefa():
+        try:
+            return funcao()
+        except ErroMaritaca as erro:
+            falhas[secao_id] = _motivo(erro)
+
+    return tarefa
+
+
+def _tolerante_stream(secao_id, funcao, falhas):
+    if falhas is None:
+        return funcao
+
+    def tarefa():
+        try:
+            yield from funcao()
+        except ErroMaritaca as erro:
+            falhas[secao_id] = _motivo(erro)
+
+    return tarefa
+
+
+def _executar_chamada(secao_id, preprompt, tema_geral, contextos, traducao):
+    prompt, secao = chamada_secao(secao_id, tema_geral, contextos, traducao)
+    return chat_with_bot(prompt, preprompt, secao=secao, prazo=prazo_secao(secao_id), hedge=HEDGE_ATIVO)
+
+
+def gerar_secoes(secoes_ids, preprompt, tema_geral, contextos, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None,
+                 falhas=None, traducao=None):
+    # ao_concluir também é chamado para as seções que falharam (com falhas);
+    # quem chama confere falhas antes de gravar.
+    tarefas = {
+        secao_id: _tolerante(
+            secao_id,
+            lambda secao_id=secao_id: _executar_chamada(secao_id, preprompt, tema_geral, contextos, traducao),
+            falhas,
+        )
+        for secao_id in secoes_ids
+    }
+    resultados = executar_concorrente(tarefas, max_concorrencia=max_concorrencia, ao_concluir=ao_concluir)
+    return {secao_id: texto for secao_id, texto in resultados.items() if secao_id not in (falhas or {})}
+
+
+def gerar_secoes_stream(secoes_ids, preprompt, tema_geral, contextos, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None,
+                        falhas=None, traducao=None):
+    def chamar(secao_id):
+        prompt, secao = chamada_secao(secao_id, tema_geral, contextos, traducao)
+        return chat_with_bot_stream(prompt, preprompt, secao=secao, prazo=prazo_secao(secao_id))
+
+    tarefas = {
+        secao_id: _tolerante_stream(secao_id, lambda secao_id=secao_id: chamar(secao_id), falhas)
+        for secao_id in secoes_ids
+    }
+    return executar_concorrente_em_fluxo(tarefas, max_concorrencia=max_concorrencia, ao_concluir=ao_concluir)
+
+
+def opts_tag(secoes_ids):
+    return "".join(SECOES[secao_id]["tag"] if secao_id in secoes_ids else "-" for secao_id in ORDEM_SECOES)
+
+
+def chave_modulo(file_hash, tema_geral, idioma, secoes_ids):
+    # Identifica o módulo inteiro (manifesto do lote); o conteúdo em si fica
+    # em cache por seção, ver chave_secao. A assinatura do roteamento (modelo
+    # e orçamento de cada seção) substitui o nome do modelo.
+    return chave_cache(
+        "escriba", file_hash or "no_file", tema_geral.strip(), idioma, opts_tag(secoes_ids), assinatura(*secoes_ids)
+    )
+
+
+def chave_secao(file_hash, tema_geral, idioma, secao_id):
+    return chave_cache(
+        "secao", file_hash or "no_file", tema_geral.strip(), idioma, secao_id, SECOES[secao_id]["versao"],
+        assinatura(secao_id),
+    )
+
+
+def secoes_em_cache(file_hash, tema_geral, idioma, secoes_ids):
+    cache = obter_cache()
+    encontradas = {}
+    for secao_id in secoes_ids:
+        texto = cache.obter(chave_secao(file_hash, tema_geral, idioma, secao_id))
+        if texto is not None:
+            encontradas[secao_id] = texto
+    return encontradas
+
+
+def secoes_de_outro_idioma(file_hash, tema_geral, idioma, secoes_ids):
+    # A versão em outro idioma com mais destas seções no cache, para traduzir
+    # em vez de gerar do material: (idioma_origem, {secao_id: texto}) ou None.
+    melhor = None
+    for outro in IDIOMAS:
+        if outro == idioma:
+            continue
+        encontradas = secoes_em_cache(file_hash, tema_geral, outro, secoes_ids)
+        if encontradas and (melhor is None or len(encontradas) > len(melhor[1])):
+            melhor = (outro, encontradas)
+    return melhor
+
+
+def gravar_secao(file_hash, tema_geral, idioma, secao_id, texto):
+    obter_cache().gravar(chave_secao(file_hash, tema_geral, idioma, secao_id), texto)
+
+
+def secoes_prontas(texto_origem, file_hash, tema_geral, idioma, secoes_ids):
+    # Seções que não precisam de API: as do cache e as que as etapas locais
+    # resolvem (gravadas no cache como as geradas).
+    resultados = secoes_em_cache(file_hash, tema_geral, idioma, secoes_ids)
+    faltantes = [secao_id for secao_id in secoes_ids if secao_id not in resultados]
+    for secao_id, texto in resolver_localmente(faltantes, texto_origem, file_hash, idioma).items():
+        gravar_secao(file_hash, tema_geral, idioma, secao_id, texto)
+        resultados[secao_id] = texto
+    return resultados
+
+
+def marcador_faltante(motivo):
+    return f"[SEÇÃO NÃO GERADA — {motivo} Gere esta seção novamente.]"
+
+
+def montar_modulo(resultados, faltantes=None):
+    # resultados: {secao_id: texto}; a ordem do módulo é sempre a canônica.
+    # faltantes: {secao_id: motivo}, seções que saem só com o título e um
+    # marcador.
+    faltantes = faltantes or {}
+    return build_texto_final([
+        SECOES[secao_id]["titulo"] + "\n" + (
+            resultados[secao_id].strip() if secao_id in resultados else marcador_faltante(faltantes[secao_id])
+        )
+        for secao_id in ORDEM_SECOES
+        if secao_id in resultados or secao_id in faltantes
+    ])
+
+
+def preparar_faltantes(faltantes, texto_origem, file_hash, tema_geral, idioma, traduzir):
+    # (contextos, traducao) das seções a pedir à API: com traduzir, as que já
+    # existem em outro idioma são traduzidas e dispensam o recorte do material.
+    traducao = secoes_de_outro_idioma(file_hash, tema_geral, idioma, faltantes) if traduzir else None
+    a_gerar = [secao_id for secao_id in faltantes if not traducao or secao_id not in traducao[1]]
+    return montar_contextos(a_gerar, texto_origem, file_hash) if a_gerar else {}, traducao
+
+
+def gerar_modulo(texto_origem, file_hash, tema_geral, idioma, secoes_ids, max_concorrencia=MAX_CONCORRENCIA, ao_concluir=None,
+                 traduzir=True):
+    # Versão sem interface da geração do Escriba. Devolve (texto_final, do_cache).
+    # O módulo é montado a partir das seções já em cache ou resolvidas
+    # localmente; das que faltam, as prontas em outro idioma são traduzidas
+    # (com traduzir) e as demais geradas, e cada uma vai para o cache assim
+    # que termina. Se alguma seção falhar ou passar do prazo, as outras
+    # seguem e, no fim, ModuloIncompleto traz o módulo com ela marcada.
+    resultados = secoes_prontas(texto_origem, file_hash, tema_geral, idioma, secoes_ids)
+    faltantes = [secao_id for secao_id in secoes_ids if secao_id not in resultados]
+    falhas = {}
+    if faltantes:
+        def concluir(secao_id, texto, concluidas, total):
+            if secao_id in falhas:
+                return
+            gravar_secao(file_hash, tema_geral, idioma, secao_id, texto)
+            if ao_concluir is not None:
+                ao_concluir(secao_id, texto, concluidas, total)
+
+        preprompt = criar_preprompt(f"Tema geral: {tema_geral}", idioma)
+        contextos, traducao = preparar_faltantes(faltantes, texto_origem, file_hash, tema_geral, idioma, traduzir)
+        resultados.update(
+            gerar_secoes(faltantes, preprompt, tema_geral, contextos, max_concorrencia, concluir, falhas, traducao)
+        )
+    texto_final = montar_modulo(resultados, falhas)
+    if falhas:
+        raise ModuloIncompleto(texto_final, falhas)
+    return texto_final, not faltantes
+
+
+def trabalho_modulo(texto_origem, file_hash, tema_geral, idioma, secoes_ids, max_concorrencia=MAX_CONCORRENCIA,
+                    traduzir=True):
+    # Função para o gerenciador de trabalhos: publica as seções em cache de
+    # imediato e as demais trecho a trecho. Devolve {secao_id: texto} das
+    # seções prontas; uma seção que falha ou passa do prazo não derruba as
+    # outras: sai do resultado e o motivo fica em detalhes[secao_id]["erro"].
+    def executar(trabalho):
+        resultados = secoes_prontas(texto_origem, file_hash, tema_geral, idioma, secoes_ids)
+        for secao_id, texto in resultados.items():
+            trabalho.anexar(secao_id, texto)
+        faltantes = [secao_id for secao_id in secoes_ids if secao_id not in resultados]
+        trabalho.progredir(0, len(faltantes))
+        falhas = {}
+        if faltantes:
+            def concluir(secao_id, texto, concluidas, total):
+                if secao_id in falhas:
+                    trabalho.descartar(secao_id)
+                    trabalho.detalhar(secao_id, erro=falhas[secao_id])
+                else:
+                    gravar_secao(file_hash, tema_geral, idioma, secao_id, texto)
+                trabalho.progredir(concluidas, total)
+
+            preprompt = criar_preprompt(f"Tema geral: {tema_geral}", idioma)
+            contextos, traducao = preparar_faltantes(faltantes, texto_origem, file_hash, tema_geral, idioma, traduzir)
+            if traducao:
+                for secao_id in traducao[1]:
+                    trabalho.detalhar(secao_id, traduzida_de=traducao[0])
+            for secao_id, trecho in gerar_secoes_stream(
+                faltantes, preprompt, tema_geral, contextos, max_concorrencia, ao_concluir=concluir, falhas=falhas,
+                traducao=traducao,
+            ):
+                if trecho is not None:
+                    trabalho.anexar(secao_id, trecho)
+        return {secao_id: trabalho.texto(secao_id) for secao_id in secoes_ids if secao_id not in falhas}
+
+    return executar
+
+
+def resumir_conversa(mensagens):
+    transcricao = "\n".join(f"{m['role']}: {m['content']}" for m in mensagens)
+    return completar([
+        {"role": "system", "content": "Você resume conversas de edição de módulos educacionais."},
+        {"role": "user", "content": (
+            "Resuma em poucas linhas os pedidos feitos e as decisões tomadas nesta conversa, "
+            "para que ajustes futuros continuem coerentes:\n\n" + transcricao
+        )},
+    ], max_tokens=400, secao="memoria")
+
+
+def refinar_secao(conversa_id, secao_id, texto_atual, pedido, tema_geral, idioma):
+    # Ajuste de uma seção já gerada por um pedido de acompanhamento. Vai para a
+    # API só a seção atual e a janela da conversa, nunca o material de base.
+    # No histórico ficam os pedidos, não as versões da seção (que sempre
+    # seguem por inteiro na mensagem final).
+    memoria = obter_memoria()
+    titulo = SECOES[secao_id]["titulo"]
+    mensagens = [criar_preprompt(f"Tema geral: {tema_geral}", idioma)]
+    mensagens += memoria.janela(conversa_id, resumidor=resumir_conversa)
+    mensagens.append({"role": "user", "content": (
+        f"{titulo}\n\nTexto atual da seção:\n{texto_atual}\n\n"
+        f"Ajuste pedido: {pedido}\n\n"
+        "Devolva a seção completa já ajustada, sem comentários sobre as mudanças."
+    )})
+    novo_texto = completar(mensagens, secao="refino")
+    memoria.adicionar(conversa_id, "user", f"{titulo}: {pedido}")
+    memoria.adicionar(conversa_id, "assistant", f"{titulo} reescrita conforme o pedido.")
+    return novo_texto
+
+
+def escrever_saidas(texto_final, destino_sem_extensao, tema_geral, idioma, formatos=("pdf", "txt")):
+    # Escreve em arquivos temporários e troca no fim, para que uma saída
+    # parcial nunca pareça concluída numa retomada.
+    caminhos = []
+    for formato in formatos:
+        caminho = f"{destino_sem_extensao}.{formato}"
+        temporario = caminho + ".tmp"
+        if formato == "pdf":
+            with open(temporario, "wb") as saida:
+                escrever_pdf_modulo(saida, texto_final, tema_geral, idioma)
+        elif formato == "txt":
+            with open(temporario, "w", encoding="utf-8") as saida:
+                saida.write(texto_final)
+        else:
+            raise ValueError(f"Formato de saída não suportado: {formato}")
+        os.replace(temporario, caminho)
+        caminhos.append(caminho)
+    return caminhos
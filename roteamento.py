@@ -0,0 +1,75 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from configuracao import obter_config
+from tokens import estimar_tokens_mensagens
+
+MODELO = "sabiazim-3"
+
+# Modelo e max_tokens de cada chamada, pela seção e pelo tamanho estimado da
+# entrada: max_tokens = base + proporcao × tokens de entrada, limitado a teto.
+# Com "modelo_acima", entradas maiores que "acima_de" tokens vão para esse
+# modelo. ESCRIBA_ROTEAMENTO (JSON) sobrepõe campos por seção, por exemplo
+# {"unidades": {"teto": 6000, "modelo_acima": "sabia-3", "acima_de": 6000}}.
+POLITICA_PADRAO = {
+    "resumo": {"base": 800, "proporcao": 0.25, "teto": 3000},
+    "introducao": {"base": 700, "proporcao": 0.1, "teto": 1500},
+    "unidades": {"base": 1500, "proporcao": 0.4, "teto": 4000},
+    "glossario": {"base": 500, "proporcao": 0.5, "teto": 2000},
+    "links": {"base": 300, "proporcao": 0.3, "teto": 1200},
+    "conclusao": {"base": 500, "proporcao": 0.1, "teto": 1200},
+    "referencias": {"base": 400, "proporcao": 0.3, "teto": 1500},
+    # Revisões e traduções devolvem um texto do tamanho do que receberam.
+    "corretor": {"base": 100, "proporcao": 1.3, "teto": 4000},
+    "traducao": {"base": 200, "proporcao": 1.3, "teto": 6000},
+    "refino": {"base": 300, "proporcao": 1.2, "teto": 4000},
+    "memoria": {"base": 400, "proporcao": 0.0, "teto": 400},
+    "padrao": {"base": 1024, "proporcao": 0.5, "teto": 2048},
+}
+# Janela de contexto (entrada + saída) por modelo.
+CONTEXTO_MODELOS = {"sabiazim-3": 32000, "sabia-3": 128000, "sabia-3.1": 128000}
+CONTEXTO_PADRAO = 32000
+MARGEM_CONTEXTO = 256
+MIN_MAX_TOKENS = 256
+
+Rota = namedtuple("Rota", ["modelo", "max_tokens", "tokens_entrada"])
+
+
+def _carregar_politica():
+    ajustes = obter_config("ESCRIBA_ROTEAMENTO") or {}
+    if isinstance(ajustes, str):
+        ajustes = json.loads(ajustes)
+    politica = {}
+    for secao in set(POLITICA_PADRAO) | set(ajustes):
+        regra = {"modelo": MODELO}
+        regra.update(POLITICA_PADRAO.get(secao, POLITICA_PADRAO["padrao"]))
+        regra.update(ajustes.get(secao, {}))
+        politica[secao] = regra
+    return politica
+
+
+POLITICA = _carregar_politica()
+
+
+def regra(secao):
+    return POLITICA.get(secao) or POLITICA["padrao"]
+
+
+def rotear(secao, mensagens):
+    # A entrada é estimada localmente (tokens.estimar_tokens_mensagens).
+    r = regra(secao)
+    entrada = estimar_tokens_mensagens(mensagens)
+    modelo = r["modelo"]
+    if r.get("modelo_acima") and entrada > r.get("acima_de", 0):
+        modelo = r["modelo_acima"]
+    max_tokens = min(r["teto"], int(r["base"] + r["proporcao"] * entrada))
+    folga = CONTEXTO_MODELOS.get(modelo, CONTEXTO_PADRAO) - entrada - MARGEM_CONTEXTO
+    return Rota(modelo, max(MIN_MAX_TOKENS, min(max_tokens, folga)), entrada)
+
+
+def assinatura(*secoes):
+    # Entra nas chaves de cache no lugar do nome do modelo: mudar a política
+    # de uma seção invalida só os resultados dela.
+    dados = json.dumps([regra(secao) for secao in secoes], sort_keys=True)
+    return hashlib.sha256(dados.encode("utf-8")).hexdigest()[:12]
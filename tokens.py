@@ -0,0 +1,16 @@
+import math
+
+# Aproximação local (sem tokenizer): textos em português ficam perto de
+# 4 caracteres por token nos modelos Sabiá.
+CARACTERES_POR_TOKEN = 4
+
+
+def estimar_tokens(texto):
+    if not texto:
+        return 0
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def estimar_tokens_mensagens(mensagens):
+    # Soma um pequeno custo fixo por mensagem (papel e separadores).
+    return sum(estimar_tokens(m.get("content", "")) + 4 for m in mensagens)
@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from armazenamento import obter_armazem
+from configuracao import obter_config
+
+MAX_TRABALHOS = int(obter_config("ESCRIBA_MAX_TRABALHOS", 4))
+# Por quanto tempo um trabalho terminado continua consultável pelo id.
+RETENCAO_SEGUNDOS = float(obter_config("ESCRIBA_RETENCAO_TRABALHOS", 15 * 60))
+
+NA_FILA = "na_fila"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+
+
+class Trabalho:
+    # Estado de uma execução em segundo plano. A função do trabalho publica
+    # trechos parciais e progresso; a interface só lê instantâneos. Os
+    # parciais são descartados quando o trabalho termina, e o resultado fica
+    # no armazém (self.resultado é o handle), sob os limites de memória dele.
+
+    def __init__(self, trabalho_id, chave):
+        self.id = trabalho_id
+        self.chave = chave
+        self.estado = NA_FILA
+        self.criado_em = time.time()
+        self.concluido_em = None
+        self.resultado = None
+        self.erro = None
+        self._parciais = {}
+        self._progresso = (0, 0)
+        self._detalhes = {}
+        self._lock = threading.Lock()
+
+    def anexar(self, parte_id, trecho):
+        with self._lock:
+            self._parciais.setdefault(parte_id, []).append(trecho)
+
+    def descartar(self, parte_id):
+        with self._lock:
+            self._parciais.pop(parte_id, None)
+
+    def progredir(self, concluidas, total):
+        with self._lock:
+            self._progresso = (concluidas, total)
+
+    def detalhar(self, parte_id, **campos):
+        # Estado por parte (por exemplo, por arquivo de um lote).
+        with self._lock:
+            self._detalhes.setdefault(parte_id, {}).update(campos)
+
+    def texto(self, parte_id):
+        with self._lock:
+            return "".join(self._parciais.get(parte_id, []))
+
+    def terminado(self):
+        return self.estado in (CONCLUIDO, FALHOU)
+
+    def encerrar(self, estado, resultado=None, erro=None):
+        handle = obter_armazem().guardar("trabalho:" + self.id, resultado) if resultado is not None else None
+        with self._lock:
+            self._parciais.clear()
+            self.resultado = handle
+            self.erro = erro
+            self.concluido_em = time.time()
+            self.estado = estado
+
+    def instantaneo(self):
+        # "resultado" é lido do armazém; None se ele o descartou por espaço.
+        with self._lock:
+            instantaneo = {
+                "id": self.id,
+                "estado": self.estado,
+                "progresso": self._progresso,
+                "parciais": {parte_id: "".join(trechos) for parte_id, trechos in self._parciais.items()},
+                "detalhes": {parte_id: dict(campos) for parte_id, campos in self._detalhes.items()},
+                "resultado": self.resultado,
+                "erro": self.erro,
+                "segundos": (self.concluido_em or time.time()) - self.criado_em,
+            }
+        if instantaneo["resultado"] is not None:
+            instantaneo["resultado"] = obter_armazem().obter(instantaneo["resultado"])
+        return instantaneo
+
+
+class GerenciadorTrabalhos:
+    # Executa trabalhos num pool do processo, fora do ciclo de reruns do
+    # Streamlit. Pedidos com a mesma chave enquanto um trabalho está em
+    # andamento recebem esse mesmo trabalho (singleflight), de qualquer sessão.
+
+    def __init__(self, max_trabalhos=MAX_TRABALHOS, retencao=RETENCAO_SEGUNDOS):
+        self.retencao = retencao
+        self._executor = ThreadPoolExecutor(max_workers=max_trabalhos, thread_name_prefix="escriba-trabalho")
+        self._trabalhos = {}
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+
+    def submeter(self, chave, funcao, ao_juntar=None):
+        # funcao(trabalho) roda no pool; o retorno vira trabalho.resultado.
+        # Se já há um trabalho com a chave, funcao não roda e ao_juntar() é
+        # chamado, por exemplo para apagar arquivos preparados para ela.
+        with self._lock:
+            self._limpar()
+            existente = self._em_andamento.get(chave)
+            if existente is None:
+                trabalho = Trabalho(uuid.uuid4().hex, chave)
+                self._trabalhos[trabalho.id] = trabalho
+                self._em_andamento[chave] = trabalho
+        if existente is not None:
+            if ao_juntar is not None:
+                ao_juntar()
+            return existente
+        self._executor.submit(self._executar, trabalho, funcao)
+        return trabalho
+
+    def obter(self, trabalho_id):
+        with self._lock:
+            return self._trabalhos.get(trabalho_id)
+
+    def _executar(self, trabalho, funcao):
+        trabalho.estado = EXECUTANDO
+        try:
+            resultado = funcao(trabalho)
+        except Exception as erro:
+            trabalho.encerrar(FALHOU, erro=erro)
+        else:
+            try:
+                trabalho.encerrar(CONCLUIDO, resultado)
+            except Exception as erro:
+                trabalho.encerrar(FALHOU, erro=erro)
+        finally:
+            with self._lock:
+                if self._em_andamento.get(trabalho.chave) is trabalho:
+                    del self._em_andamento[trabalho.chave]
+
+    def _limpar(self):
+        limite = time.time() - self.retencao
+        for trabalho_id in [
+            t.id for t in self._trabalhos.values() if t.concluido_em is not None and t.concluido_em < limite
+        ]:
+            trabalho = self._trabalhos.pop(trabalho_id)
+            if trabalho.resultado is not None:
+                obter_armazem().liberar(trabalho.resultado)
+
+
+_gerenciador = None
+_gerenciador_lock = threading.Lock()
+
+
+def obter_gerenciador():
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorTrabalhos()
+        return _gerenciador